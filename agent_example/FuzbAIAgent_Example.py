@@ -15,6 +15,12 @@ def send_motor_commands(cmds):
     motors_url = f"http://{HOST_ADDRESS}/Motors/SendCommand?blue=False"
     response = requests.post(motors_url, json=cmds)
 
+def exchange(cmds, frame_id):
+    # Send the motor commands and wait for the next camera frame in a single request
+    exchange_url = f"http://{HOST_ADDRESS}/Motors/Exchange?blue=False&frameId={frame_id}"
+    response = requests.post(exchange_url, json=cmds)
+    return response.json(), int(response.headers["X-Frame-ID"])
+
 # Main player agent class
 class PlayerAgent():
     def __init__(self):
@@ -149,12 +155,11 @@ class PlayerAgent():
 # Instantiate the agent
 agent = PlayerAgent()
 
-while True:
-    time.sleep(0.02)
-
-    # Get camera data
-    camData = get_camera_state()    
+# Get the initial camera data
+camData = get_camera_state()    
+frameID = 0
 
+while True:
     CD0 = camData["camData"][0]
     CD1 = camData["camData"][1]        
 
@@ -166,5 +171,5 @@ while True:
     # Process the camera data and return motor commands
     motorData = agent.process_data(camData)
 
-    # Send the motor commands
-    send_motor_commands({'commands': motorData })
\ No newline at end of file
+    # Send the motor commands and get the next camera data
+    camData, frameID = exchange({'commands': motorData }, frameID)
\ No newline at end of file
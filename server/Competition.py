@@ -0,0 +1,159 @@
+import os
+import json
+import math
+import asyncio
+
+# Competition (player against the FuzbAI) on a table, driven by the camera frames.
+#
+# The player plays blue, the FuzbAI red. States as shown by Render.html:
+#   0: no competition
+#   1: competition started, waiting for the ball
+#   2: game running
+#   3: game over, results shown
+#
+# A game ends when one of the teams scores goalLimit goals or the play time runs out. The results keep
+# the best game of every player, ranked by the goal difference and then by the play time left.
+#
+# The state changes only with the frames and the control requests, so the JSON answers of the polled
+# endpoints are built once per change and the subscribers are notified through changeEvent.
+
+STATE_IDLE = 0
+STATE_WAITING = 1
+STATE_RUNNING = 2
+STATE_FINISHED = 3
+
+class Competition:
+    def __init__(self, resultsFile=None, playTime=120, goalLimit=5, startSpeed=0.1):
+        self.resultsFile = resultsFile
+        self.playTime = playTime
+        self.goalLimit = goalLimit
+        self.startSpeed = startSpeed
+
+        self.results = []
+        if resultsFile is not None and os.path.exists(resultsFile):
+            with open(resultsFile) as f:
+                self.results = json.load(f)
+
+        self.state = STATE_IDLE
+        self.playerName = ""
+        self.level = 0
+        self.lastResultIndex = -1
+
+        self.score = [0, 0]  # Red (FuzbAI), blue (player) as sent by the simulator
+        self.startScore = [0, 0]
+        self.startTime = None
+        self.timeLeft = playTime
+        self.events = []
+
+        # Precomputed answers, replaced on every change
+        self.version = 0
+        self.changeEvent = asyncio.Event()
+        self.key = None
+        self.publish()
+
+    def start(self, playerName, level=0):
+        self.state = STATE_WAITING
+        self.playerName = playerName
+        self.level = level
+        self.startScore = list(self.score)
+        self.startTime = None
+        self.timeLeft = self.playTime
+        self.events = []
+        self.publish()
+
+    def stop(self):
+        self.state = STATE_IDLE
+        self.publish()
+
+    def matchScore(self):
+        # Goals of the current game as (player, FuzbAI)
+        if self.state == STATE_IDLE:
+            return self.score[1], self.score[0]
+        return self.score[1] - self.startScore[1], self.score[0] - self.startScore[0]
+
+    def update(self, t, camStat):
+        score = camStat.get("score")
+        if score is not None:
+            if score[0] < self.score[0] or score[1] < self.score[1]:
+                # Simulator restarted
+                self.startScore = [0, 0]
+            previous = self.score
+            self.score = [score[0], score[1]]
+        else:
+            previous = self.score
+
+        if self.state == STATE_WAITING:
+            cd = camStat["camData"][0]
+            if math.hypot(cd["ball_vx"], cd["ball_vy"]) > self.startSpeed:
+                self.state = STATE_RUNNING
+                self.startTime = t
+                self.startScore = list(self.score)
+                previous = self.score
+
+        if self.state == STATE_RUNNING:
+            gameTime = t - self.startTime
+            for team, playerID in ((1, 0), (0, 1)):
+                for _ in range(self.score[team] - previous[team]):
+                    self.events.append({ "eventType": "goal", "playerID": playerID, "gameTimestamp": int(gameTime * 1000) })
+
+            self.timeLeft = max(self.playTime - gameTime, 0)
+            if self.timeLeft <= 0 or max(self.matchScore()) >= self.goalLimit:
+                self.finish(gameTime)
+
+        self.publish()
+
+    def finish(self, gameTime):
+        self.state = STATE_FINISHED
+        self.events.append({ "eventType": "end", "gameTimestamp": int(gameTime * 1000) })
+
+        scorePlayer, scoreFuzbAI = self.matchScore()
+        # The overlay shows the play time left as gameTimeSinceLastGoal
+        game = { "playerName": self.playerName, "level": self.level, "gameScorePlayer": scorePlayer, "gameScoreFuzbAI": scoreFuzbAI,
+                 "gameTimeSinceLastGoal": int(self.timeLeft * 1000), "gameEvents": { "gameEvents": self.events }, "gamesPlayed": 1 }
+
+        previous = next((r for r in self.results if r["playerName"] == self.playerName), None)
+        if previous is None:
+            self.results.append(game)
+        else:
+            game["gamesPlayed"] = previous["gamesPlayed"] + 1
+            if rank(game) < rank(previous):
+                self.results[self.results.index(previous)] = game
+            else:
+                previous["gamesPlayed"] = game["gamesPlayed"]
+
+        self.results.sort(key=rank)
+        self.lastResultIndex = next(i for i, r in enumerate(self.results) if r["playerName"] == self.playerName)
+
+        if self.resultsFile is not None:
+            os.makedirs(os.path.dirname(self.resultsFile) or ".", exist_ok=True)
+            with open(self.resultsFile, 'w') as f:
+                json.dump(self.results, f)
+
+    def publish(self):
+        # Rebuild the answers only if something the clients see has changed (the clock in whole seconds)
+        scorePlayer, scoreFuzbAI = self.matchScore()
+        key = (self.state, math.ceil(self.timeLeft), scorePlayer, scoreFuzbAI, self.playerName, self.level, len(self.results), self.lastResultIndex)
+        if key == self.key:
+            return
+        self.key = key
+
+        state = { "state": self.state, "time": math.ceil(self.timeLeft), "playerName": self.playerName,
+                  "scorePlayer": scorePlayer, "scoreFuzbAI": scoreFuzbAI, "level": self.level }
+
+        self.stateJson = json.dumps(dict(state, results=[], lastResultIndex=self.lastResultIndex)).encode('utf-8')
+        self.resultsJson = json.dumps(dict(state, results=self.results, lastResultIndex=self.lastResultIndex)).encode('utf-8')
+        self.scoreJson = json.dumps({ "player": scorePlayer, "fuzbAI": scoreFuzbAI, "level": self.level }).encode('utf-8')
+
+        self.version += 1
+        self.changeEvent.set()
+        self.changeEvent = asyncio.Event()
+
+    async def waitForChange(self, version, timeout):
+        if self.version <= version:
+            try:
+                await asyncio.wait_for(self.changeEvent.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+def rank(game):
+    return (game["gameScoreFuzbAI"] - game["gameScorePlayer"], -game["gameTimeSinceLastGoal"])
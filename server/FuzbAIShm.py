@@ -0,0 +1,151 @@
+import os
+import sys
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+# Shared-memory transport between FuzbAISimWrapper and FuzbAISimServer running on the same host.
+# Keep this file identical in server/ and wrapper/src/.
+#
+# The server creates the block (and removes it when it stops), the simulator only attaches to it.
+# Every block gets a new nonzero generation, set to 0 when the server closes it, so the simulator can
+# detect a stopped or restarted server and attach again.
+#
+# The payloads are the FuzbAIWire binary datagrams. Layout of the shared block:
+#   header:        magic, version, number of camera slots, generation, number of written camera frames (uint64)
+#   camera slots:  ring of SLOT_SIZE bytes slots, the latest frame is in slot (count-1) % CAMERA_SLOTS
+#   command slots: one per team (red, blue)
+# Every slot starts with a sequence counter and the payload length. The writer makes the counter
+# odd while writing and even when done (seqlock), and the reader retries if the counter changed
+# while it was copying the payload.
+
+MAGIC = 0x465A5348 # "FZSH"
+VERSION = 2
+
+CAMERA_SLOTS = 8
+SLOT_SIZE = 256
+
+HEADER = struct.Struct('<IIIIQ')
+SLOT = struct.Struct('<II')
+
+GENERATION_OFFSET = 12
+COUNT_OFFSET = 16
+CAMERA_OFFSET = HEADER.size
+COMMAND_OFFSET = CAMERA_OFFSET + CAMERA_SLOTS * SLOT_SIZE
+SIZE = COMMAND_OFFSET + 2 * SLOT_SIZE
+
+def blockName(table):
+    return f"fuzbai_table{table}"
+
+def openBlock(name):
+    # Attaches without registering the block with the resource tracker, which would remove it when this process exits
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+class SharedTransport:
+    def __init__(self, name, create=False):
+        # create: server side, replaces a block left over by a server that did not stop cleanly.
+        # Otherwise attaches to the server's block (FileNotFoundError if the server is not running).
+        self.name = name
+        self.owner = create
+
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+            except FileExistsError:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+
+            self.generation = struct.unpack('<I', os.urandom(4))[0] or 1
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, CAMERA_SLOTS, self.generation, 0)
+        else:
+            self.shm = openBlock(name)
+
+            magic, version, _, self.generation, _ = HEADER.unpack_from(self.shm.buf, 0)
+            if magic != MAGIC or version != VERSION:
+                self.shm.close()
+                raise ValueError(f"Incompatible shared memory block {name}")
+
+        self.buf = self.shm.buf
+
+    def close(self):
+        if self.owner:
+            struct.pack_into('<I', self.buf, GENERATION_OFFSET, 0)
+
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def replaced(self):
+        # True if the server closed this block or created a new one since it was attached
+        if struct.unpack_from('<I', self.buf, GENERATION_OFFSET)[0] != self.generation:
+            return True
+
+        try:
+            current = openBlock(self.name)
+        except FileNotFoundError:
+            return True
+
+        try:
+            return struct.unpack_from('<I', current.buf, GENERATION_OFFSET)[0] != self.generation
+        finally:
+            current.close()
+
+    def writeSlot(self, offset, data):
+        if len(data) > SLOT_SIZE - SLOT.size:
+            raise ValueError("Payload too large for a shared memory slot")
+
+        seq, _ = SLOT.unpack_from(self.buf, offset)
+        SLOT.pack_into(self.buf, offset, seq + 1, len(data))
+        self.buf[offset + SLOT.size : offset + SLOT.size + len(data)] = data
+        SLOT.pack_into(self.buf, offset, seq + 2, len(data))
+
+    def readSlot(self, offset, retries=100):
+        for _ in range(retries):
+            seq, length = SLOT.unpack_from(self.buf, offset)
+            if seq & 1:
+                continue
+
+            data = bytes(self.buf[offset + SLOT.size : offset + SLOT.size + length])
+            if SLOT.unpack_from(self.buf, offset)[0] == seq:
+                return seq, data
+
+        return None
+
+    def writeCamera(self, data):
+        count = struct.unpack_from('<Q', self.buf, COUNT_OFFSET)[0]
+        self.writeSlot(CAMERA_OFFSET + (count % CAMERA_SLOTS) * SLOT_SIZE, data)
+        struct.pack_into('<Q', self.buf, COUNT_OFFSET, count + 1)
+
+    def readCamera(self, lastCount):
+        # Returns (frame count, latest camera payload) if a frame was written after lastCount, otherwise None
+        count = struct.unpack_from('<Q', self.buf, COUNT_OFFSET)[0]
+        if count == lastCount:
+            return None
+
+        slot = self.readSlot(CAMERA_OFFSET + ((count - 1) % CAMERA_SLOTS) * SLOT_SIZE)
+        if slot is None:
+            return None
+
+        return count, slot[1]
+
+    def writeCommands(self, team, data):
+        self.writeSlot(COMMAND_OFFSET + team * SLOT_SIZE, data)
+
+    def commandSeq(self, team):
+        # Sequence of the latest commands in the slot, to ignore the ones written before attaching
+        return SLOT.unpack_from(self.buf, COMMAND_OFFSET + team * SLOT_SIZE)[0]
+
+    def readCommands(self, team, lastSeq):
+        # Returns (slot sequence, commands payload) if new commands were written after lastSeq, otherwise None
+        offset = COMMAND_OFFSET + team * SLOT_SIZE
+        if SLOT.unpack_from(self.buf, offset)[0] == lastSeq:
+            return None
+
+        return self.readSlot(offset)
@@ -1,45 +1,386 @@
-import threading
+import asyncio
 import signal
 import time
-import sys
 import json
 import uvicorn
 import argparse
-from fastapi import FastAPI, Response, Request
+from fastapi import FastAPI, APIRouter, Response, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List
+from contextlib import asynccontextmanager
 
+import os
+import re
+import sys
 import socket
-from mimetypes import guess_type
-from os.path import isfile
+import struct
+import FuzbAIWire
+import FuzbAIShm
+import ReplayStore
+import StaticCache
+import MatchStats
+import Competition
 
 host_name = "127.0.0.1"
 port = 23336
 UDP_PORT_TX = 15006
 UDP_PORT_RX = 15005
 UDP_PORT_RX_blue = 15004
+UDP_PORT_STRIDE = 10 # Port offset between consecutive tables
+tableCount = 1
+transport = "udp"
+shmPollInterval = 0.001
+embedded = False
+simDir = "../wrapper/src"
+embeddedPollInterval = 0.005
+replayDir = "./logs"
+recordReplays = False # Camera frames and commands take about 12 MB/min per table
+replayMaxBytes = 1024**3 # Per table, the oldest segments are removed first
+wwwDir = "./www"
+watchStatic = False
+clientCommandTimeout = 0.5 # An agent silent for longer than this (in s) may restart its command numbering
+
+router = APIRouter()
+
+# Files served from www/
+staticCache = None
+staticWatcher = None
+
+# Registered tables by table ID
+tables = {}
+
+class CameraProtocol(asyncio.DatagramProtocol):
+    def __init__(self, table):
+        self.table = table
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.table.receiveCamera(data)
+
+    def error_received(self, exc):
+        self.table.framesDropped += 1
+
+class Table:
+    def __init__(self, tableId, index):
+        self.id = tableId
+        self.index = index
+
+        # Each table uses its own set of UDP ports
+        self.portTx = UDP_PORT_TX + index * UDP_PORT_STRIDE
+        self.portRx = UDP_PORT_RX + index * UDP_PORT_STRIDE
+        self.portRxBlue = UDP_PORT_RX_blue + index * UDP_PORT_STRIDE
+
+        # Latest camera frame as (frame ID, red payload, blue payload), replaced as a whole on arrival
+        self.frame = (0, b"", b"")
+
+        # Set (and replaced) on every new camera frame
+        self.frameEvent = asyncio.Event()
+
+        self.framesReceived = 0
+        self.framesDropped = 0
+        self.framesLost = 0
+        self.simFrameId = None  # Frame ID assigned by the simulator to the latest frame
+        self.frameTime = 0  # Arrival time of the latest frame
+        self.binary = False # Sim sends binary frames - reply with binary commands
+        self.commandSeq = [0, 0]  # Red, blue
+
+        # Latest (seq, timestamp, arrival time) of the commands numbered by each team's agent, and the ones rejected as out of order
+        self.clientCommands = [None, None]
+        self.commandsRejected = [0, 0]
+
+        # UDP endpoint for camera data and motor commands
+        self.protocol = None
+
+        # Shared memory block and its polling task (shared memory transport only)
+        self.shm = None
+        self.shmPoller = None
+
+        # Simulator running in this process and its polling task (embedded mode only)
+        self.sim = None
+        self.simPoller = None
+
+        # Recording of the camera frames and motor commands
+        self.replayStore = None
+
+        # Statistics of the current match, updated with every frame and command
+        self.stats = MatchStats.MatchStats(os.path.join(wwwDir, 'geometry.json'))
+
+        # Competition shown by the Render.html overlays, results kept with the replay logs
+        self.competition = Competition.Competition(os.path.join(replayDir, tableId, 'competition.json') if replayDir else None)
+
+    async def start(self):
+        if recordReplays and replayDir:
+            self.replayStore = ReplayStore.ReplayStore(os.path.join(replayDir, self.id), maxBytes=replayMaxBytes)
+
+        if embedded and self.index == 0:
+            self.startSim()
+            return
+
+        if transport == 'shm':
+            self.shm = FuzbAIShm.SharedTransport(FuzbAIShm.blockName(self.index), create=True)
+            self.shmPoller = asyncio.create_task(self.pollShm())
+            return
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind((host_name, self.portTx))
+
+        # Camera datagrams are handled in the event loop as they arrive
+        _, self.protocol = await asyncio.get_running_loop().create_datagram_endpoint(lambda: CameraProtocol(self), sock=sock)
+
+    async def pollShm(self):
+        # Shared memory has no arrival notification, so check the frame counter periodically
+        count = 0
+        while True:
+            frame = self.shm.readCamera(count)
+            if frame is not None:
+                count, data = frame
+                self.receiveCamera(data)
+
+            await asyncio.sleep(shmPollInterval)
+
+    def startSim(self):
+        # The simulator loads its models relative to its own directory
+        cwd = os.getcwd()
+        os.chdir(simDir)
+        try:
+            sys.path.insert(0, os.getcwd())
+            import FuzbAISim
+            self.sim = FuzbAISim.FuzbAISim()
+        finally:
+            os.chdir(cwd)
+
+        self.sim.run()
+        self.simPoller = asyncio.create_task(self.pollSim())
+
+    async def pollSim(self):
+        # Publish the delayed camera state whenever the simulator has sampled a new one
+        lastCamStat = None
+        while True:
+            try:
+                camStat = self.sim.getDelayedCamera(1, self.sim.t - self.sim.simulatedDelay)
+            except (IndexError, TypeError):
+                camStat = None
+
+            if camStat is not None and camStat is not lastCamStat:
+                lastCamStat = camStat
+                try:
+                    blueStats = mirrorCameraState(camStat)
+                    self.frameTime = time.time()
+                    self.framesReceived += 1
+                    self.updateStats(camStat)
+                    self.competition.update(self.frameTime, camStat)
+                    self.setFrame(json.dumps(camStat).encode('utf-8'), blueStats, self.frameTime)
+                except (KeyError, IndexError, TypeError):
+                    self.framesDropped += 1
+
+            await asyncio.sleep(embeddedPollInterval)
+
+    def receiveCamera(self, data):
+        # Both perspectives are serialized once per frame
+        try:
+            if FuzbAIWire.isBinary(data):
+                simFrameId, _, _, camStat = FuzbAIWire.decodeCamera(data)
+                camStat["frameID"] = simFrameId
+                data = json.dumps(camStat).encode('utf-8')
+                self.binary = True
+            else:
+                camStat = json.loads(data)
+                simFrameId = camStat.get("frameID")
+                self.binary = False
+
+            blueStats = mirrorCameraState(camStat)
+        except (ValueError, KeyError, IndexError, TypeError, struct.error):
+            self.framesDropped += 1
+            return
 
-app = FastAPI()
+        self.countLostFrames(simFrameId)
 
-cameraStat = ""
+        self.frameTime = time.time()
+        self.framesReceived += 1
+        self.updateStats(camStat)
+        self.competition.update(self.frameTime, camStat)
+        self.setFrame(data, blueStats, self.frameTime)
 
-def serverThread():
-    global cameraStat
-    while True:
+    def updateStats(self, camStat):
+        cd = camStat["camData"][0]
+        self.stats.update(self.frameTime, (cd["ball_x"], cd["ball_y"], cd["ball_vx"], cd["ball_vy"]), camStat.get("score"))
+
+    def countLostFrames(self, simFrameId):
+        # The simulator numbers its frames consecutively, so a gap means lost datagrams
+        if simFrameId is None:
+            return
+
+        if self.simFrameId is not None and simFrameId > self.simFrameId + 1:
+            self.framesLost += simFrameId - self.simFrameId - 1
+
+        # A lower frame ID means that the simulator was restarted
+        self.simFrameId = simFrameId
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.transport.close()
+
+        if self.shmPoller is not None:
+            self.shmPoller.cancel()
+            self.shm.close()
+
+        if self.simPoller is not None:
+            self.simPoller.cancel()
+            self.sim.stop()
+
+        if self.replayStore is not None:
+            self.replayStore.close()
+
+    def info(self):
+        return { "id": self.id, "portTx": self.portTx, "portRx": self.portRx, "portRxBlue": self.portRxBlue, "embedded": self.sim is not None }
+
+    def setFrame(self, redStats, blueStats, t):
+        self.frame = (self.frame[0] + 1, redStats, blueStats)
+
+        self.frameEvent.set()
+        self.frameEvent = asyncio.Event()
+
+        if self.replayStore is not None:
+            self.replayStore.append(ReplayStore.KIND_CAMERA, redStats, t)
+
+    def getCameraFrame(self, blue):
+        frameId, redStats, blueStats = self.frame
+        return frameId, (blueStats if blue else redStats)
+
+    async def waitForFrame(self, frameId, timeout):
+        # Wait until a camera frame newer than frameId arrives or the timeout expires
+        deadline = time.monotonic() + timeout
+        while self.frame[0] <= frameId:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self.frameEvent.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    def sendCommands(self, body, blue):
+        if self.replayStore is not None:
+            self.replayStore.append(ReplayStore.KIND_COMMANDS_BLUE if blue else ReplayStore.KIND_COMMANDS_RED, body)
+
+        # Commands are tagged with a per-team sequence number and send time, so the simulator
+        # can drop the ones delivered out of order and expire the stale ones
         try:
-            data, addr = sock.recvfrom(4000)
-            cameraStat = data.decode('utf-8')            
-        except socket.error:
-            pass
-
-if __name__ != "__main__":
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setblocking(0)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.bind((host_name, UDP_PORT_TX))
-    threading.Thread(target=serverThread, daemon=True).start()
+            message = json.loads(body)
+            commands = message["commands"]
+
+            team = 1 if blue else 0
+            if not self.checkClientOrder(team, message.get("seq"), message.get("timestamp")):
+                self.commandsRejected[team] += 1
+                return False
+
+            self.commandSeq[team] += 1
+            seq = self.commandSeq[team]
+
+            if self.binary or self.shm is not None:
+                body = FuzbAIWire.encodeCommands(commands, seq, 0, time.time())
+            else:
+                body = json.dumps({ "seq": seq, "timestamp": time.time(), "commands": commands }).encode('utf-8')
+        except (ValueError, KeyError, TypeError, struct.error):
+            return False
+
+        self.stats.command(team)
+
+        if self.sim is not None:
+            # Commands go straight into the simulator's command slots
+            if hasattr(self.sim, "setExternalCommands"):
+                self.sim.setExternalCommands(team + 1, commands, seq, time.time())
+            elif blue:
+                self.sim.motorCommandsExternal2 = commands
+            else:
+                self.sim.motorCommandsExternal1 = commands
+            return True
+
+        if self.shm is not None:
+            self.shm.writeCommands(team, body)
+        elif blue:        
+            self.protocol.transport.sendto(body, (host_name, self.portRxBlue)) 
+        else:
+            self.protocol.transport.sendto(body, (host_name, self.portRx)) 
+        return True
+
+    def checkClientOrder(self, team, seq, timestamp):
+        # Commands numbered (seq) or timestamped by the agent must advance its numbering,
+        # unless the agent was silent long enough to have been restarted
+        if seq is None and timestamp is None:
+            return True
+
+        now = time.time()
+        last = self.clientCommands[team]
+        if last is not None and now - last[2] <= clientCommandTimeout:
+            lastSeq, lastTimestamp, _ = last
+            if seq is not None and lastSeq is not None:
+                if seq <= lastSeq:
+                    return False
+            elif timestamp is not None and lastTimestamp is not None and timestamp <= lastTimestamp:
+                return False
+
+        self.clientCommands[team] = (seq, timestamp, now)
+        return True
+
+def mirrorCameraState(camStat):
+    blueStats = dict(camStat)
+    blueStats["camData"] = [dict(cd) for cd in camStat["camData"]]
+
+    # Reverse the field
+    for cd in blueStats["camData"]:
+        cd["ball_x"] = 1210 - cd["ball_x"]
+        cd["ball_y"] = 700 - cd["ball_y"]
+
+        cd["ball_vx"] = -cd["ball_vx"]
+        cd["ball_vy"] = -cd["ball_vy"]
+
+        cd["rod_position_calib"] = [1-cd["rod_position_calib"][7-i] for i in range(8)]
+        cd["rod_angle"] = [-cd["rod_angle"][7-i] for i in range(8)]    
+
+    return json.dumps(blueStats).encode('utf-8')
+
+def validName(name):
+    # Table IDs and replay names become file and directory names under replayDir
+    return re.fullmatch(r'[A-Za-z0-9_.-]{1,64}', name) is not None and name not in ('.', '..') and os.path.basename(name) == name
+
+async def addTable(tableId):
+    # Use the lowest free port set
+    used = [t.index for t in tables.values()]
+    index = next(i for i in range(len(used) + 1) if i not in used)
+
+    table = Table(tableId, index)
+    await table.start()
+    tables[tableId] = table
+    return table
+
+@asynccontextmanager
+async def lifespan(app):
+    # Opens the tables (UDP sockets or shared memory) on startup and closes them on shutdown
+    global staticCache, staticWatcher
+
+    staticCache = StaticCache.StaticCache(wwwDir, watch=watchStatic)
+    if watchStatic:
+        staticWatcher = asyncio.create_task(staticCache.watchFiles())
+
+    for i in range(tableCount):
+        await addTable(str(i))
+
+    yield
+
+    if staticWatcher is not None:
+        staticWatcher.cancel()
+
+    for table in tables.values():
+        table.close()
+
+app = FastAPI(lifespan=lifespan)
 
 class MotorCommand(BaseModel):
     driveID : int
@@ -51,68 +392,347 @@ class MotorCommand(BaseModel):
 class MotorCommands(BaseModel):
     commands : List[MotorCommand]
 
-@app.get('/Camera/State')
-async def camera_state(blue : bool | None = None):         
-    stats = cameraStat
+@app.get('/tables')
+async def list_tables():
+    return { "tables": [t.info() for t in tables.values()] }
 
-    if blue:
-        blueStats = json.loads(stats)
+@app.put('/tables/{tableId}')
+async def add_table(tableId : str):
+    if not validName(tableId):
+        return Response(status_code=400)
 
-        # Reverse the field
-        blueStats["camData"][0]["ball_x"] = 1210 - blueStats["camData"][0]["ball_x"]
-        blueStats["camData"][0]["ball_y"] = 700 - blueStats["camData"][0]["ball_y"]
+    table = tables.get(tableId)
+    if table is None:
+        table = await addTable(tableId)
 
-        blueStats["camData"][0]["ball_vx"] = -blueStats["camData"][0]["ball_vx"]
-        blueStats["camData"][0]["ball_vy"] = -blueStats["camData"][0]["ball_vy"]
+    return table.info()
 
-        blueStats["camData"][0]["rod_position_calib"] = [1-blueStats["camData"][0]["rod_position_calib"][7-i] for i in range(8)]
-        blueStats["camData"][0]["rod_angle"] = [-blueStats["camData"][0]["rod_angle"][7-i] for i in range(8)]    
+@app.delete('/tables/{tableId}')
+async def remove_table(tableId : str):
+    table = tables.pop(tableId, None)
+    if table is None:
+        return Response(status_code=404)
 
+    table.close()
+    return table.info()
 
-        blueStats["camData"][1]["ball_x"] = 1210 - blueStats["camData"][1]["ball_x"]
-        blueStats["camData"][1]["ball_y"] = 700 - blueStats["camData"][1]["ball_y"]
+# The routes below are available for every table as /tables/{tableId}/..., and for the first table (ID "0") without the prefix
 
-        blueStats["camData"][1]["ball_vx"] = -blueStats["camData"][1]["ball_vx"]
-        blueStats["camData"][1]["ball_vy"] = -blueStats["camData"][1]["ball_vy"]
+@router.get('/Camera/State')
+async def camera_state(blue : bool | None = None, tableId : str = "0"):         
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
 
-        blueStats["camData"][1]["rod_position_calib"] = [1-blueStats["camData"][1]["rod_position_calib"][7-i] for i in range(8)]
-        blueStats["camData"][1]["rod_angle"] = [-blueStats["camData"][1]["rod_angle"][7-i] for i in range(8)]    
+    frameId, stats = table.getCameraFrame(blue)
+    return Response(content=stats, media_type="text/json", headers={ "X-Frame-ID": str(frameId) })       
 
-        stats = json.dumps(blueStats)
 
-    return Response(content=stats, media_type="text/json")       
+@router.post('/Motors/SendCommand')
+async def send_command(request : Request, blue : bool | None = None, tableId : str = "0"): #MotorCommands): 
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
 
+    if not table.sendCommands(await request.body(), blue):
+        return { "Result": "Commands rejected (invalid or out of order)" }
 
-@app.post('/Motors/SendCommand')
-async def send_command(request : Request, blue : bool | None = None): #MotorCommands): 
-    if blue:        
-        sock.sendto(await request.body(), (host_name, UDP_PORT_RX_blue)) 
-    else:
-        sock.sendto(await request.body(), (host_name, UDP_PORT_RX)) 
     return { "Result": "Setting reference..." }    
 
-@app.get('/Competition')
-async def competion_state():
-   return { "state": 2, "time": 0, "playerName": 'SimBlue', "scorePlayer": 0, "scoreFuzbAI": 0, "level": 0, "results": [] }
+@router.post('/Motors/Exchange')
+async def exchange(request : Request, blue : bool | None = None, frameId : int | None = None, timeout : float = 0.1, tableId : str = "0"):
+    # Send the motor commands and return the camera state in a single round trip.
+    # If frameId is given, wait (up to timeout seconds) for a newer camera frame.
+    # Rejected commands (invalid or out of order) are reported with X-Commands-Rejected, the camera state is returned anyway.
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    accepted = table.sendCommands(await request.body(), blue)
+
+    if frameId is not None:
+        await table.waitForFrame(frameId, min(timeout, 5.0))
+
+    frameId, stats = table.getCameraFrame(blue)
+    return Response(content=stats, media_type="text/json", headers={ "X-Frame-ID": str(frameId), "X-Commands-Rejected": "0" if accepted else "1" })
+
+async def receiveCommands(websocket, table, blue):
+    # Motor commands sent back over the camera stream socket
+    try:
+        while True:
+            table.sendCommands((await websocket.receive_text()).encode('utf-8'), blue)
+    except WebSocketDisconnect:
+        pass
+
+@router.websocket('/Camera/Stream')
+async def camera_stream(websocket : WebSocket, blue : bool | None = None, maxRate : float | None = None, tableId : str = "0"):
+    # Push every new camera frame (at most maxRate frames per second) to the client
+    table = tables.get(tableId)
+    if table is None:
+        await websocket.close()
+        return
+
+    await websocket.accept()
+    receiver = asyncio.create_task(receiveCommands(websocket, table, blue))
+
+    minPeriod = 1.0 / maxRate if maxRate else 0
+    frameId = 0
+    lastSent = 0
+
+    try:
+        while not receiver.done():
+            await table.waitForFrame(frameId, 1.0)
+            if table.frame[0] <= frameId:
+                continue
+
+            if minPeriod > 0:
+                # Skip the frames that arrive before the next send slot
+                delay = lastSent + minPeriod - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            frameId, stats = table.getCameraFrame(blue)
+            await websocket.send_bytes(stats)
+            lastSent = time.monotonic()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+@router.get('/Camera/Stats')
+async def camera_stats(tableId : str = "0"):
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    frameTime = table.frameTime
+    return { "frameID": table.frame[0], "framesReceived": table.framesReceived, "framesDropped": table.framesDropped, "framesLost": table.framesLost,
+             "commandsRejected": table.commandsRejected,
+             "frameTime": frameTime, "frameAge": time.time() - frameTime if frameTime > 0 else None }
+
+@router.get('/Statistics')
+async def statistics(tableId : str = "0"):
+    # Statistics of the current match (see MatchStats.py)
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    return table.stats.summary()
+
+@router.post('/Statistics/Reset')
+async def reset_statistics(tableId : str = "0"):
+    # Ends the match statistics: returns them, saves them with the replay logs and starts new ones
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    summary = table.stats.summary()
+    if replayDir:
+        path = os.path.join(replayDir, table.id)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, time.strftime('stats_%Y%m%d_%H%M%S.json')), 'w') as f:
+            json.dump(summary, f)
+
+    table.stats.reset()
+    return summary
+
+@router.put('/Agent')
+async def set_agent(blue : bool = False, policy : str = "", tableId : str = "0"):
+    # Built-in agent of the embedded simulator: an exported policy (.npz, relative to --sim-dir) or the default agent
+    table = tables.get(tableId)
+    if table is None or table.sim is None or not hasattr(table.sim, "setAgent"):
+        return Response(status_code=404)
+
+    path = policy
+    if path and not os.path.isabs(path):
+        path = os.path.join(simDir, path)
+
+    try:
+        table.sim.setAgent(2 if blue else 1, path or None)
+    except (OSError, ValueError, KeyError):
+        return Response(status_code=400)
+
+    return { "blue": blue, "policy": policy or "default" }
+
+def getReplayStore(tableId):
+    table = tables.get(tableId)
+    return table.replayStore if table is not None else None
+
+@router.get('/Camera/SaveReplay')
+async def save_replay(name : str = "replay", tableId : str = "0"):
+    if not validName(name):
+        return Response(status_code=400)
+
+    replayStore = getReplayStore(tableId)
+    if replayStore is None:
+        return Response(status_code=404)
+
+    return replayStore.saveBookmark(name)
 
-@app.get('/{filename}')
-async def serve_static(filename):     
-    filename = './www/' + filename
+@router.get('/Camera/StartReplay')
+async def start_replay(tableId : str = "0"):
+    replayStore = getReplayStore(tableId)
+    if replayStore is None:
+        return Response(status_code=404)
+
+    replayStore.startReplay()
+    return { "start": replayStore.replayStart, "end": replayStore.replayEnd }
+
+@router.get('/Camera/ReplayLogsList')
+async def replay_logs_list(tableId : str = "0"):
+    replayStore = getReplayStore(tableId)
+    if replayStore is None:
+        return { "logs": [] }
+
+    return { "logs": [b["name"] for b in reversed(replayStore.bookmarks)] }
+
+@router.get('/Camera/ReplayLogLoad')
+async def replay_log_load(file : str, tableId : str = "0"):
+    replayStore = getReplayStore(tableId)
+    if replayStore is None or replayStore.loadBookmark(file) is None:
+        return Response(status_code=404)
+
+    return { "start": replayStore.replayStart, "end": replayStore.replayEnd }
 
-    if not isfile(filename):
+@router.get('/Camera/Replay')
+async def replay(location : float = 0, blue : bool | None = None, tableId : str = "0"):
+    replayStore = getReplayStore(tableId)
+    frame = replayStore.replayAt(location) if replayStore is not None else None
+    if frame is None:
         return Response(status_code=404)
 
-    with open(filename) as f:
-        content = f.read()
+    timestamp, payload = frame
+    camStat = json.loads(payload)
+    if blue:
+        camStat = json.loads(mirrorCameraState(camStat))
 
-    content_type, _ = guess_type(filename)
-    return Response(content, media_type=content_type)
+    # Render.html shows the time of the replayed frame
+    for cd in camStat["camData"]:
+        cd["timestamp"] = timestamp * 1000
+
+    return camStat
+
+@router.get('/Competition')
+async def competion_state(noResults : bool = False, tableId : str = "0"):
+    # Precomputed by Competition.publish
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    competition = table.competition
+    return Response(content=competition.stateJson if noResults else competition.resultsJson, media_type="application/json")
+
+@router.get('/Score')
+async def score(tableId : str = "0"):
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    return Response(content=table.competition.scoreJson, media_type="application/json")
+
+@router.post('/Competition/Start')
+async def competition_start(playerName : str, level : int = 0, tableId : str = "0"):
+    # New game of the player against the FuzbAI, the clock starts when the ball is in play
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    table.competition.start(playerName, level)
+    table.stats.reset()
+    return Response(content=table.competition.stateJson, media_type="application/json")
+
+@router.post('/Competition/Stop')
+async def competition_stop(tableId : str = "0"):
+    table = tables.get(tableId)
+    if table is None:
+        return Response(status_code=404)
+
+    table.competition.stop()
+    return Response(content=table.competition.stateJson, media_type="application/json")
+
+async def waitForDisconnect(websocket):
+    # Messages from the client are ignored
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+@router.websocket('/Competition/Stream')
+async def competition_stream(websocket : WebSocket, tableId : str = "0"):
+    # Push the competition state (without the results) whenever it changes
+    table = tables.get(tableId)
+    if table is None:
+        await websocket.close()
+        return
+
+    await websocket.accept()
+    receiver = asyncio.create_task(waitForDisconnect(websocket))
+    competition = table.competition
+    version = 0
+
+    try:
+        while not receiver.done():
+            await competition.waitForChange(version, 1.0)
+            if competition.version <= version:
+                continue
+
+            version = competition.version
+            await websocket.send_text(competition.stateJson.decode('utf-8'))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+app.include_router(router)
+app.include_router(router, prefix="/tables/{tableId}")
+
+@app.get('/{filename:path}')
+@app.get('/tables/{tableId}/{filename:path}')
+async def serve_static(filename, request : Request):     
+    static = staticCache.get(filename)
+
+    if static is None:
+        return Response(status_code=404)
+
+    useGzip = static.gzipContent is not None and "gzip" in request.headers.get("accept-encoding", "")
+    etag = static.gzipEtag if useGzip else static.etag
+
+    headers = { "ETag": etag, "Cache-Control": staticCache.cacheControl, "Vary": "Accept-Encoding" }
+
+    ifNoneMatch = request.headers.get("if-none-match")
+    if ifNoneMatch is not None and (ifNoneMatch.strip() == "*" or etag in [t.strip() for t in ifNoneMatch.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    if useGzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(static.gzipContent, media_type=static.contentType, headers=headers)
+
+    return Response(static.content, media_type=static.contentType, headers=headers)
 
 
 if __name__ == "__main__":        
     parser = argparse.ArgumentParser(prog='FuzbAI server')
     parser.add_argument('--port', type=int, default=port, help='HTTP REST port number')
+    parser.add_argument('--replay-dir', default=replayDir, help='Directory for the replay logs, statistics and competition results')
+    parser.add_argument('--record', action='store_true', help='Record the camera frames and commands for replays')
+    parser.add_argument('--replay-max-mb', type=int, default=replayMaxBytes // 1024**2, help='Disk space for the recordings of one table (in MB)')
+    parser.add_argument('--watch-static', action='store_true', help='Reload modified files in www/ (development)')
+    parser.add_argument('--tables', type=int, default=tableCount, help=f'Number of tables to start with (table i uses UDP ports offset by {UDP_PORT_STRIDE}*i)')
+    parser.add_argument('--transport', choices=['udp', 'shm'], default=transport, help='Transport to the simulators (shm: shared memory, same host only)')
+    parser.add_argument('--embedded', action='store_true', help='Run the simulator for table 0 inside the server process')
+    parser.add_argument('--sim-dir', default=simDir, help='Directory with FuzbAISim.py (embedded mode)')
     args = parser.parse_args()
 
+    tableCount = args.tables
+    transport = args.transport
+    embedded = args.embedded
+    simDir = args.sim_dir
+
+    replayDir = args.replay_dir
+    recordReplays = args.record
+    replayMaxBytes = args.replay_max_mb * 1024**2
+    watchStatic = args.watch_static
+
     print(f"Starting server\n http://{host_name}:{args.port}/Render.html")
-    uvicorn.run("FuzbAISimServer:app", port=args.port, log_level="warning")    
+    uvicorn.run(app, host=host_name, port=args.port, log_level="warning")    
@@ -0,0 +1,187 @@
+import json
+import math
+import numpy as np
+
+# Match statistics, updated incrementally in constant time and memory per update.
+# Keep this file identical in sim/ and server/ (tests/test_shared.py): both run from their own directory
+# and are distributed separately, so neither imports from the other.
+#
+# The simulator (sim/FuzbAISim.py) feeds it every physics step with the ball contacts of the figures,
+# the server feeds it every camera frame; without contacts a rod counts as touching the ball while the
+# ball is within reach of it.
+#
+# Ball position and velocity are in camera coordinates of the red player (mm, m/s), teams are 0 (red) and 1 (blue).
+#
+# Tracked:
+#   possession:  time since the last touch, per rod (and team)
+#   shots:       ball leaving a rod towards the opponent's goal faster than shotSpeed, count and peak speed per team
+#   goals:       per team, with the time from the ball drop to the goal
+#   heatmap:     time the ball spent in every zone of the field
+#   stalls:      ball slower than stallSpeed for stallTime
+#   redrops:     ball put back on the field (goals, stalls, manual drops)
+#   commands:    motor commands per team
+
+class MatchStats:
+    def __init__(self, geometryFile='geometry.json', zones=(12, 7), shotSpeed=2.0, stallSpeed=0.05, stallTime=1.0, reach=25, jump=150):
+        with open(geometryFile) as f:
+            geometry = json.load(f)
+
+        self.fieldX = geometry["field"]["dimension_x"]
+        self.fieldY = geometry["field"]["dimension_y"]
+        self.rodX = np.array([r["position"] for r in geometry["rods"]], dtype=np.float64)
+        self.rodTeam = [0 if r["team"] == "red" else 1 for r in geometry["rods"]]
+
+        self.zones = zones
+        self.shotSpeed = shotSpeed
+        self.stallSpeed = stallSpeed
+        self.stallTime = stallTime
+        self.reach = reach
+        self.jump = jump
+
+        self.reset()
+
+    def reset(self):
+        self.startTime = None
+        self.lastTime = None
+        self.duration = 0.0
+
+        self.possession = np.zeros(len(self.rodX))
+        self.possessor = None
+
+        self.shots = [0, 0]
+        self.shotSpeedSum = [0.0, 0.0]
+        self.shotSpeedMax = [0.0, 0.0]
+        self.shot = None  # Shot in progress as [team, peak speed]
+
+        self.goals = [0, 0]
+        self.goalTimeSum = 0.0
+        self.goalTimeMin = None
+        self.goalTimeMax = None
+        self.rallyStart = None
+        self.lastScore = None
+
+        self.heatmap = np.zeros((self.zones[1], self.zones[0]))
+
+        self.stalls = 0
+        self.stallStart = None
+        self.stalled = False
+
+        self.redrops = 0
+        self.lastBall = None
+
+        self.commands = [0, 0]
+
+    def command(self, team):
+        self.commands[team] += 1
+
+    def update(self, t, ball, score=None, touchedRods=None, redrop=None):
+        # ball: (x, y, vx, vy); touchedRods: rods touching the ball (None without contact data);
+        # redrop: the ball has been put back on the field (None: detected from a jump of the ball position)
+        x, y, vx, vy = ball
+
+        if self.lastTime is None:
+            self.startTime = self.lastTime = self.rallyStart = t
+
+        dt = max(t - self.lastTime, 0)
+        self.lastTime = t
+        self.duration += dt
+
+        speed = math.hypot(vx, vy)
+
+        # Goals, timed from the latest drop
+        if score is not None:
+            if self.lastScore is not None:
+                for team in range(2):
+                    scored = score[team] - self.lastScore[team]
+                    if scored > 0:
+                        self.goals[team] += scored
+                        goalTime = t - self.rallyStart
+                        self.goalTimeSum += goalTime
+                        self.goalTimeMin = goalTime if self.goalTimeMin is None else min(self.goalTimeMin, goalTime)
+                        self.goalTimeMax = goalTime if self.goalTimeMax is None else max(self.goalTimeMax, goalTime)
+                        self.rallyStart = t
+            self.lastScore = (score[0], score[1])
+
+        if redrop is None:
+            redrop = self.lastBall is not None and math.hypot(x - self.lastBall[0], y - self.lastBall[1]) > self.jump
+        self.lastBall = (x, y)
+
+        if redrop:
+            self.redrops += 1
+            self.rallyStart = t
+            self.possessor = None
+            self.shot = None
+
+        # Possession by the rod that touched the ball last
+        if touchedRods is None:
+            rod = int(np.argmin(np.abs(self.rodX - x)))
+            if abs(self.rodX[rod] - x) < self.reach:
+                self.possessor = rod
+        elif len(touchedRods) > 0:
+            self.possessor = touchedRods[-1]
+
+        if self.possessor is not None:
+            self.possession[self.possessor] += dt
+
+        # Shots: counted when the ball leaves fast towards the opponent's goal, the speed is the peak until it slows down
+        if self.shot is None:
+            if speed > self.shotSpeed and self.possessor is not None:
+                team = self.rodTeam[self.possessor]
+                if (vx > 0) == (team == 0):
+                    self.shot = [team, speed]
+                    self.shots[team] += 1
+        elif speed > self.shotSpeed / 2:
+            self.shot[1] = max(self.shot[1], speed)
+        else:
+            self.finishShot()
+
+        # Time in the zones of the field
+        ix = min(max(int(x * self.zones[0] / self.fieldX), 0), self.zones[0] - 1)
+        iy = min(max(int(y * self.zones[1] / self.fieldY), 0), self.zones[1] - 1)
+        self.heatmap[iy, ix] += dt
+
+        # Stalls, counted once per stationary period
+        if speed < self.stallSpeed:
+            if self.stallStart is None:
+                self.stallStart = t
+            elif not self.stalled and t - self.stallStart >= self.stallTime:
+                self.stalls += 1
+                self.stalled = True
+        else:
+            self.stallStart = None
+            self.stalled = False
+
+    def finishShot(self):
+        team, peak = self.shot
+        self.shotSpeedSum[team] += peak
+        self.shotSpeedMax[team] = max(self.shotSpeedMax[team], peak)
+        self.shot = None
+
+    def summary(self):
+        duration = max(self.duration, 1e-9)
+        goals = sum(self.goals)
+        teamPossession = [float(sum(self.possession[i] for i in range(len(self.rodX)) if self.rodTeam[i] == team)) for team in range(2)]
+
+        # Including the shot in progress
+        speedSum = list(self.shotSpeedSum)
+        speedMax = list(self.shotSpeedMax)
+        if self.shot is not None:
+            speedSum[self.shot[0]] += self.shot[1]
+            speedMax[self.shot[0]] = max(speedMax[self.shot[0]], self.shot[1])
+
+        return { "duration": self.duration,
+                 "possession": { "rods": self.possession.tolist(), "teams": teamPossession },
+                 "shots": self.shots,
+                 "shotSpeedMean": [speedSum[i] / self.shots[i] if self.shots[i] > 0 else None for i in range(2)],
+                 "shotSpeedMax": speedMax,
+                 "goals": self.goals,
+                 "timeToGoal": { "mean": self.goalTimeSum / goals if goals > 0 else None, "min": self.goalTimeMin, "max": self.goalTimeMax },
+                 "heatmap": (self.heatmap / duration).tolist(),
+                 "stalls": self.stalls,
+                 "redrops": self.redrops,
+                 "commands": self.commands,
+                 "commandRate": [c / duration for c in self.commands] }
+
+    def dump(self, fileName):
+        with open(fileName, 'w') as f:
+            json.dump(self.summary(), f)
@@ -0,0 +1,271 @@
+import os
+import mmap
+import json
+import time
+import struct
+import bisect
+
+# Append-only recording of camera frames and motor commands for the replay endpoints.
+#
+# The log is split into segments, each made of two files:
+#   <start>.dat: records (timestamp, kind, payload length) followed by the payload
+#   <start>.idx: fixed-size (timestamp, offset) entries of the camera records in <start>.dat
+# where <start> is the segment start time in milliseconds. Reads go through memory-mapped
+# files, so replaying only touches the pages around the requested time.
+#
+# Saved replays are bookmarks (name, start and end time) in bookmarks.jsonl and reference
+# the segments instead of copying them. Bookmarked segments are kept when old segments are removed,
+# which happens when there are more than maxSegments of them or they take more than maxBytes.
+#
+# A crash can leave a partially written record at the end of a segment, so the segments found on
+# start are trimmed to their last complete record.
+
+KIND_CAMERA = 1
+KIND_COMMANDS_RED = 2
+KIND_COMMANDS_BLUE = 3
+
+RECORD = struct.Struct('<dBI')
+INDEX = struct.Struct('<dQ')
+
+class Segment:
+    def __init__(self, path, start):
+        self.path = path
+        self.start = start
+        self.end = start
+        self.maps = {}
+
+    def fileName(self, ext):
+        return os.path.join(self.path, f"{int(self.start * 1000)}.{ext}")
+
+    def map(self, ext):
+        # (Re)map the file if it has grown since it was last mapped
+        size = os.path.getsize(self.fileName(ext))
+        m = self.maps.get(ext)
+
+        if m is None or len(m) < size:
+            if m is not None:
+                m.close()
+            m = None
+            if size > 0:
+                with open(self.fileName(ext), 'rb') as f:
+                    m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self.maps[ext] = m
+
+        return m
+
+    def close(self):
+        for m in self.maps.values():
+            if m is not None:
+                m.close()
+        self.maps = {}
+
+    def cameraAt(self, t):
+        # Camera record closest to (at or before) t
+        idx = self.map('idx')
+        if idx is None:
+            return None
+
+        count = len(idx) // INDEX.size
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX.unpack_from(idx, mid * INDEX.size)[0] <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        timestamp, offset = INDEX.unpack_from(idx, max(lo - 1, 0) * INDEX.size)
+
+        dat = self.map('dat')
+        if dat is None or offset + RECORD.size > len(dat):
+            return None
+
+        _, _, length = RECORD.unpack_from(dat, offset)
+        if offset + RECORD.size + length > len(dat):
+            return None
+
+        return timestamp, dat[offset + RECORD.size : offset + RECORD.size + length]
+
+    def repair(self):
+        # Drops the index entries and the trailing record that were not completely written
+        with open(self.fileName('idx'), 'rb') as f:
+            idx = f.read()
+        datSize = os.path.getsize(self.fileName('dat'))
+
+        with open(self.fileName('dat'), 'rb') as dat:
+            def recordEnd(offset):
+                # End of the record at offset, None if it is incomplete
+                if offset + RECORD.size > datSize:
+                    return None
+                dat.seek(offset)
+                _, _, length = RECORD.unpack(dat.read(RECORD.size))
+                end = offset + RECORD.size + length
+                return end if end <= datSize else None
+
+            valid = len(idx) // INDEX.size
+            end = 0
+            while valid > 0:
+                offset = INDEX.unpack_from(idx, (valid - 1) * INDEX.size)[1]
+                if recordEnd(offset) is not None:
+                    end = offset
+                    break
+                valid -= 1
+
+            # Motor commands can follow the last camera frame
+            while True:
+                next = recordEnd(end)
+                if next is None:
+                    break
+                end = next
+
+        if valid * INDEX.size != len(idx):
+            os.truncate(self.fileName('idx'), valid * INDEX.size)
+        if end != datSize:
+            os.truncate(self.fileName('dat'), end)
+
+    def size(self):
+        return sum(os.path.getsize(self.fileName(ext)) for ext in ('dat', 'idx'))
+
+class ReplayStore:
+    def __init__(self, path='./logs', segmentDuration=60, maxSegments=120, maxBytes=1024**3, replayWindow=10):
+        self.path = path
+        self.segmentDuration = segmentDuration
+        self.maxSegments = maxSegments
+        self.maxBytes = maxBytes
+        self.replayWindow = replayWindow
+
+        os.makedirs(path, exist_ok=True)
+
+        self.segments = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.idx'):
+                self.segments.append(self.openSegment(int(name[:-4]) / 1000))
+
+        self.bookmarks = []
+        bookmarksFile = os.path.join(path, 'bookmarks.jsonl')
+        if os.path.isfile(bookmarksFile):
+            with open(bookmarksFile) as f:
+                self.bookmarks = [json.loads(line) for line in f if line.strip()]
+
+        self.active = None
+        self.datFile = None
+        self.idxFile = None
+        self.datOffset = 0
+
+        # Time window used by the replay requests
+        self.replayStart = 0
+        self.replayEnd = 0
+
+    def openSegment(self, start):
+        segment = Segment(self.path, start)
+        if not os.path.isfile(segment.fileName('dat')):
+            open(segment.fileName('dat'), 'ab').close()
+        segment.repair()
+
+        idx = segment.map('idx')
+        if idx is not None and len(idx) >= INDEX.size:
+            segment.end = INDEX.unpack_from(idx, len(idx) - INDEX.size)[0]
+        return segment
+
+    def close(self):
+        if self.datFile is not None:
+            self.datFile.close()
+            self.idxFile.close()
+            self.datFile = None
+            self.idxFile = None
+
+        for segment in self.segments:
+            segment.close()
+
+    def rotate(self, t):
+        self.close()
+
+        self.active = Segment(self.path, t)
+        self.segments.append(self.active)
+        self.datFile = open(self.active.fileName('dat'), 'ab')
+        self.idxFile = open(self.active.fileName('idx'), 'ab')
+        self.datOffset = 0
+
+        # Remove the oldest segments that are not referenced by a bookmark
+        sizes = { segment: segment.size() for segment in self.segments }
+        while len(self.segments) > self.maxSegments or sum(sizes[s] for s in self.segments) > self.maxBytes:
+            removable = [s for s in self.segments[:-1] if not self.isBookmarked(s)]
+            if len(removable) == 0:
+                break
+
+            segment = removable[0]
+            segment.close()
+            os.remove(segment.fileName('dat'))
+            os.remove(segment.fileName('idx'))
+            self.segments.remove(segment)
+            del sizes[segment]
+
+    def isBookmarked(self, segment):
+        return any(b["start"] <= segment.end and b["end"] >= segment.start for b in self.bookmarks)
+
+    def append(self, kind, payload, t=None):
+        if t is None:
+            t = time.time()
+
+        if self.active is None or t - self.active.start > self.segmentDuration:
+            self.rotate(t)
+
+        if kind == KIND_CAMERA:
+            self.idxFile.write(INDEX.pack(t, self.datOffset))
+            self.active.end = t
+
+        self.datFile.write(RECORD.pack(t, kind, len(payload)))
+        self.datFile.write(payload)
+        self.datOffset += RECORD.size + len(payload)
+
+    def flush(self):
+        if self.datFile is not None:
+            self.datFile.flush()
+            self.idxFile.flush()
+
+    def cameraAt(self, t):
+        # Returns (timestamp, camera payload) of the frame recorded at (or just before) t
+        if len(self.segments) == 0:
+            return None
+
+        self.flush()
+
+        i = bisect.bisect_right([s.start for s in self.segments], t) - 1
+        for segment in reversed(self.segments[:max(i, 0) + 1]):
+            frame = segment.cameraAt(t)
+            if frame is not None:
+                return frame
+
+        return None
+
+    def saveBookmark(self, name):
+        t = time.time()
+        bookmark = { "name": f"{name}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(t))}", "start": t - self.replayWindow, "end": t }
+
+        self.bookmarks.append(bookmark)
+        with open(os.path.join(self.path, 'bookmarks.jsonl'), 'a') as f:
+            f.write(json.dumps(bookmark) + "\n")
+
+        self.setReplay(bookmark["start"], bookmark["end"])
+        return bookmark
+
+    def loadBookmark(self, name):
+        for bookmark in self.bookmarks:
+            if bookmark["name"] == name:
+                self.setReplay(bookmark["start"], bookmark["end"])
+                return bookmark
+
+        return None
+
+    def setReplay(self, start, end):
+        self.replayStart = start
+        self.replayEnd = end
+
+    def startReplay(self):
+        t = time.time()
+        self.setReplay(t - self.replayWindow, t)
+
+    def replayAt(self, location):
+        # Camera frame at the relative location (0 to 1) in the replay window
+        location = min(max(location, 0.0), 1.0)
+        return self.cameraAt(self.replayStart + location * (self.replayEnd - self.replayStart))
@@ -0,0 +1,79 @@
+import os
+import gzip
+import asyncio
+import hashlib
+from mimetypes import guess_type
+
+# In-memory cache of the static web files (www/), loaded once at startup.
+# Compressible files are also kept gzipped. Each variant has a strong ETag computed from its content.
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+class StaticFile:
+    def __init__(self, fileName):
+        with open(fileName, 'rb') as f:
+            self.content = f.read()
+
+        self.mtime = os.path.getmtime(fileName)
+        self.contentType, _ = guess_type(fileName)
+        if self.contentType is None:
+            self.contentType = "application/octet-stream"
+
+        digest = hashlib.sha1(self.content).hexdigest()
+        self.etag = f'"{digest}"'
+
+        self.gzipContent = None
+        self.gzipEtag = None
+        if self.contentType.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(self.content, compresslevel=9, mtime=0)
+            if len(compressed) < len(self.content):
+                self.gzipContent = compressed
+                self.gzipEtag = f'"{digest}-gz"'
+
+class StaticCache:
+    def __init__(self, root, maxAge=3600, watch=False):
+        self.root = root
+        self.watch = watch
+
+        # Revalidate every request while the files are being edited
+        self.cacheControl = "no-cache" if watch else f"public, max-age={maxAge}"
+
+        self.files = {}
+        self.reload()
+
+    def scan(self):
+        # Relative path (with forward slashes) -> modification time of all files under root
+        found = {}
+        for dirPath, _, fileNames in os.walk(self.root):
+            for fileName in fileNames:
+                fullName = os.path.join(dirPath, fileName)
+                found[os.path.relpath(fullName, self.root).replace(os.sep, '/')] = os.path.getmtime(fullName)
+        return found
+
+    def reload(self):
+        found = self.scan()
+
+        files = {}
+        for name, mtime in found.items():
+            cached = self.files.get(name)
+            if cached is not None and cached.mtime == mtime:
+                files[name] = cached
+            else:
+                files[name] = StaticFile(os.path.join(self.root, name))
+
+        changed = files.keys() != self.files.keys() or any(files[n] is not self.files.get(n) for n in files)
+        self.files = files
+        return changed
+
+    def get(self, name):
+        return self.files.get(name)
+
+    async def watchFiles(self, interval=1.0):
+        # Poll for modified, added or removed files (development mode)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.reload():
+                    print("Static files reloaded")
+            except OSError:
+                pass
@@ -0,0 +1,193 @@
+import json
+import os
+import numpy as np
+import pybullet as p
+
+# Model of the rod motors, for all 8 rods at once (rod 0 is the red goalie).
+#
+# Motor commands are converted to per-rod reference arrays and pass through:
+#   - command latency: commands are applied latency seconds after they were given
+#   - deadband: small reversals of the translation reference are ignored
+#   - rate limiting: references move towards their targets with at most maxVelocity * commanded velocity,
+#     (setJointMotorControlArray has no velocity limit, so the limit is applied to the references)
+# and are sent to the simulator with one batched motor control call per joint type.
+#
+# Gains, forces and maximal velocities are loaded from actuator.json, "rods" can override them per rod.
+#
+# The simulator in sim/ drives both teams the same way. With tableConventions (wrapper simulator, as on the
+# real table) the blue rods turn by -rotationTargetPosition and the red rods move to
+# 1 - translationTargetPosition of their travel.
+#
+# Keep this file identical in sim/ and wrapper/src/.
+
+DEFAULT_CONFIG = {
+    "latency": 0.0,
+    "deadband": 0.005,
+    "rotation": { "maxVelocity": 174.74649915501303, "force": 2.0943448919793832, "positionGain": 2.817867199313025, "velocityGain": 7.574019729635704 },
+    "translation": { "maxVelocity": 1.5910861528058136, "force": 13.303989530423438, "positionGain": 0.19343157707177333, "velocityGain": 3.9227062400839023 },
+    "rods": {}
+}
+
+# Drive ID (1 to 4) -> rod index, per team
+DRIVE_MAP = { "red": [0, 1, 3, 5], "blue": [7, 6, 4, 2] }
+
+PARAMETERS = ["maxVelocity", "force", "positionGain", "velocityGain"]
+
+class ActuatorModel:
+    def __init__(self, bodyId, revJoints, slideJoints, travels, config='actuator.json', tableConventions=False):
+        self.bodyId = bodyId
+        self.tableConventions = tableConventions
+        self.revJoints = list(revJoints)
+        self.slideJoints = list(slideJoints)
+        self.travels = np.array(travels, dtype=np.float64) / 1000
+
+        cfg = json.loads(json.dumps(DEFAULT_CONFIG))
+        if isinstance(config, str):
+            if os.path.isfile(config):
+                with open(config) as f:
+                    loaded = json.load(f)
+                for k, v in loaded.items():
+                    if isinstance(v, dict) and k in ("rotation", "translation"):
+                        cfg[k].update(v)
+                    else:
+                        cfg[k] = v
+        elif config is not None:
+            cfg.update(config)
+        self.config = cfg
+
+        self.latency = cfg["latency"]
+
+        # Rods that follow the commands, the others hold their references
+        self.active = np.ones(8, dtype=bool)
+        self.deadband = cfg["deadband"]
+
+        # Per-rod parameter tables, e.g. self.rotation["positionGain"][rod]
+        self.rotation = self.loadTable("rotation")
+        self.translation = self.loadTable("translation")
+
+        self.reset()
+
+    def loadTable(self, axis):
+        table = { k: np.full(8, self.config[axis][k], dtype=np.float64) for k in PARAMETERS }
+        for rod, override in self.config["rods"].items():
+            for k, v in override.get(axis, {}).items():
+                table[k][int(rod)] = v
+        return table
+
+    def setParameters(self, parameters):
+        # Sets parameters for all rods, e.g. { "latency": 0.01, "rotation": { "force": 2.5 } }
+        for k, v in parameters.items():
+            if k in ("rotation", "translation"):
+                table = getattr(self, k)
+                for name, value in v.items():
+                    table[name][:] = value
+            elif k in ("latency", "deadband"):
+                setattr(self, k, v)
+
+        # New gains and forces are sent with the next update
+        self.dirty = True
+
+    def setActive(self, rods=None):
+        # Rod indices (0 is the red goalie) that follow the commands, None for all
+        self.active[:] = rods is None
+        if rods is not None:
+            self.active[list(rods)] = True
+
+    def reset(self, rotation=None, translation=None):
+        # Targets requested by the commands and the references sent to the motors (joint positions, rad and m)
+        self.rotTarget = np.zeros(8) if rotation is None else np.array(rotation, dtype=np.float64)
+        self.linTarget = np.zeros(8) if translation is None else np.array(translation, dtype=np.float64)
+        self.rotRef = self.rotTarget.copy()
+        self.linRef = self.linTarget.copy()
+
+        # Velocity limits of the current commands (rad/s, m/s)
+        self.rotRate = self.rotation["maxVelocity"].copy()
+        self.linRate = self.translation["maxVelocity"].copy()
+
+        # Deadband state
+        self.prevRefPositions = self.linTarget.copy()
+        self.motionDirection = np.ones(8)
+
+        # Commands waiting for their latency, as (due time, rod mask, rotation target, rotation rate, translation target, translation rate)
+        self.pending = []
+
+        self.lastTime = None
+
+        # Send the references on the next update even if they do not change
+        self.dirty = rotation is not None or translation is not None
+
+    def command(self, team, commands, t):
+        # Converts the motor commands of a team into rod arrays and queues them
+        if len(commands) == 0:
+            return
+
+        mask = np.zeros(8, dtype=bool)
+        rot = np.zeros(8)
+        rotVel = np.zeros(8)
+        lin = np.zeros(8)
+        linVel = np.zeros(8)
+
+        driveMap = DRIVE_MAP[team]
+        for m in commands:
+            rod = driveMap[m["driveID"]-1]
+            mask[rod] = True
+            rot[rod] = m["rotationTargetPosition"]
+            rotVel[rod] = m["rotationVelocity"]
+            lin[rod] = m["translationTargetPosition"]
+            linVel[rod] = m["translationVelocity"]
+
+        if self.tableConventions:
+            if team == "blue":
+                rot = -rot
+            else:
+                lin = 1 - lin
+
+        self.pending.append((t + self.latency, mask, rot * 2 * np.pi, self.rotation["maxVelocity"] * rotVel,
+                             self.travels * lin, self.translation["maxVelocity"] * linVel))
+
+    def applyDeadband(self, mask, newPos):
+        motionDiff = newPos - self.prevRefPositions
+        direction = self.motionDirection
+
+        # Changed direction forward / backward, or motion in the same direction
+        forward = (motionDiff > self.deadband) & (direction <= 0)
+        backward = (motionDiff < -self.deadband) & (direction >= 0)
+        same = ((direction >= 0) & (motionDiff > 0)) | ((direction <= 0) & (motionDiff < 0))
+
+        accept = mask & (forward | backward | same)
+        direction[mask & forward] = 1
+        direction[mask & backward] = -1
+
+        # Inside the deadband - keep the previous reference
+        self.prevRefPositions[accept] = newPos[accept]
+        return self.prevRefPositions.copy()
+
+    def update(self, t):
+        # Release the commands whose latency has passed
+        while len(self.pending) > 0 and self.pending[0][0] <= t:
+            _, mask, rot, rotRate, lin, linRate = self.pending.pop(0)
+            mask = mask & self.active
+
+            self.rotTarget[mask] = rot[mask]
+            self.rotRate[mask] = rotRate[mask]
+            self.linTarget[mask] = self.applyDeadband(mask, lin)[mask]
+            self.linRate[mask] = linRate[mask]
+
+        dt = 0 if self.lastTime is None else t - self.lastTime
+        self.lastTime = t
+
+        # Move the references towards the targets with the commanded velocity
+        rotRef = self.rotRef + np.clip(self.rotTarget - self.rotRef, -self.rotRate * dt, self.rotRate * dt)
+        linRef = self.linRef + np.clip(self.linTarget - self.linRef, -self.linRate * dt, self.linRate * dt)
+
+        if not self.dirty and np.array_equal(rotRef, self.rotRef) and np.array_equal(linRef, self.linRef):
+            return
+
+        self.dirty = False
+        self.rotRef = rotRef
+        self.linRef = linRef
+
+        p.setJointMotorControlArray(self.bodyId, self.revJoints, controlMode=p.POSITION_CONTROL, targetPositions=rotRef,
+                                    forces=self.rotation["force"], positionGains=self.rotation["positionGain"], velocityGains=self.rotation["velocityGain"])
+        p.setJointMotorControlArray(self.bodyId, self.slideJoints, controlMode=p.POSITION_CONTROL, targetPositions=linRef,
+                                    forces=self.translation["force"], positionGains=self.translation["positionGain"], velocityGains=self.translation["velocityGain"])
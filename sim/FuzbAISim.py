@@ -4,10 +4,43 @@ import time, datetime
 import threading
 import math
 from FuzbAIAgent_Example import *
+from CameraPipeline import CameraPipeline
+from ActuatorModel import ActuatorModel
+from PolicyAgent import PolicyAgent
+from MatchStats import MatchStats
 import random
+import json
+import os
+
+# Physics parameters of the ball, the table and the motors (the "actuator" section overrides actuator.json for all rods)
+DEFAULT_PHYSICS = {
+    "format": 1,
+    "version": 0,
+    "ball": { "mass": 0.0287, "lateralFriction": 0.2, "rollingFriction": 0.00005, "spinningFriction": 0.01, "restitution": 0.7 },
+    "table": { "restitution": 0.8 },
+    "actuator": {}
+}
+
+def loadPhysics(fileName):
+    physics = json.loads(json.dumps(DEFAULT_PHYSICS))
+    if not os.path.isfile(fileName):
+        return physics
+
+    with open(fileName) as f:
+        loaded = json.load(f)
+
+    if loaded.get("format") != DEFAULT_PHYSICS["format"]:
+        print(f"[ERROR] Unsupported physics parameter format in {fileName}, using defaults")
+        return physics
+
+    for k in ("ball", "table"):
+        physics[k].update(loaded.get(k, {}))
+    physics["actuator"] = loaded.get("actuator", {})
+    physics["version"] = loaded.get("version", 0)
+    return physics
 
 class FuzbAISim:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, redPolicy=None, bluePolicy=None, seed=None, stepped=False):
         print(" ______         _             _____ ")
         print("|  ____|       | |      /\   |_   _|")
         print("| |__ _   _ ___| |__   /  \    | |  ")
@@ -36,6 +69,14 @@ class FuzbAISim:
 
         self.defaultBallPos = [0.718,0.71,0.3]
 
+        # Drop a stationary ball to a random location (disabled while a drill places the ball, see Scenarios.py)
+        self.autoBall = True
+        self.ballDropped = False
+
+        # Match statistics, updated every step (written to statsFile when the simulation stops, if set)
+        self.stats = MatchStats('geometry.json')
+        self.statsFile = None
+
         # Player object indices in the URDF tree model
         self.redPlayers = [ 2, 5, 6, 14, 15, 16, 17, 18, 28, 29, 30 ]
         self.bluePlayers = [ 9, 10, 11, 21, 22, 23, 24, 25, 33, 34, 37 ]
@@ -47,18 +88,39 @@ class FuzbAISim:
         self.travels = [190, 356, 180, 116, 116, 180, 356, 190]
         self.redIndices = [0, 1, 3, 5]
 
-        self.p1 = PlayerAgentRL(team="red")  # Red team
-        self.p2 = PlayerAgentRL(team="blue")  # Blue team
-
-        # Camera delay settings
+        # Player link -> (rod index, team). The players of a rod follow its revolute joint in the URDF tree
+        self.linkRods = {}
+        for link in self.redPlayers + self.bluePlayers:
+            rod = max(i for i in range(8) if self.revJoints[i] < link)
+            self.linkRods[link] = (rod, "red" if link in self.redPlayers else "blue")
+
+        # Ball contacts with the players in the latest physics step, the time they were read at,
+        # and the rods that touched the ball since the last takeTouchedRods (read from other threads)
+        self.contacts = []
+        self.contactTime = None
+        self.touchedRods = set()
+        self.touchedLock = threading.Lock()
+        self.timeStep = 0.002
+
+        self.p1 = None  # Red team
+        self.p2 = None  # Blue team
+        self.setAgent(1, redPolicy)
+        self.setAgent(2, bluePolicy)
+
+        # Camera delay settings (callers ask for t - simulatedDelay, the actual latency comes from the camera pipeline)
         self.simulatedDelay = 0.040
-        self.delayedMemory = []
-        self.maxMemory = 0.5 # Maximum delay time
 
-        # Deadband settings
-        self.prevRefPositions = [0]*8
-        self.motionDirection = [1]*8
-        self.motorDeadband = 0.005
+        # Camera frame rate, latency, dropouts and occlusion (camera.json)
+        self.camera = CameraPipeline(self, 'camera.json')
+
+        # Rod motors (actuator.json), created with the table model
+        self.actuators = None
+
+        # Fitted physics parameters (physics.json, written by SysId.py)
+        self.physics = loadPhysics('physics.json')
+
+        # Seeded random generators (seed None: from the system)
+        self.seed(seed)
 
         self.debug=debug
         self.loadSimulator(False)
@@ -66,7 +128,15 @@ class FuzbAISim:
         self.isRunning = False
         self.simThread = None
 
+        # Stepped mode: fixed physics steps of timeStep paced to the wall clock, instead of realtime simulation.
+        # Required for recording (MatchLog.py)
+        self.stepped = stepped
+        self.step = 0
+        self.recorder = None
+        self.recordRequest = None
+
         self.t = 0
+        self.ballMovingTime = 0
 
         self.status_player1 = 0
         self.status_player2 = 0
@@ -74,13 +144,25 @@ class FuzbAISim:
         self.motorCommandsExternal1 = []
         self.motorCommandsExternal2 = []
 
+    def setAgent(self, player, policy=None):
+        """
+        Sets the built-in agent of a player: PlayerAgentRL, or an exported policy (.npz, see PolicyAgent.py).
+        """
+        team = "red" if player == 1 else "blue"
+        agent = PlayerAgentRL(team=team) if policy is None else PolicyAgent(policy, team)
+
+        if player == 1:
+            self.p1 = agent
+        else:
+            self.p2 = agent
+
     def getCameraDict(self, player = 1):
         if self.ballPos is None or self.ballVel is None:
             print("[ERROR] Ball position or velocity is None!")
             return {"camData": [{"ball_x": 0, "ball_y": 0, "ball_vx": 0, "ball_vy": 0}], "score": self.score}
 
         ball_x, ball_y = 1000*self.ballPos[0] - 115, 730 - 1000*self.ballPos[1]
-        ball_vx, ball_vy = self.ballVel[0][0] + (random.random() - 0.5) * self.ballVelNoise, -self.ballVel[0][1] + (random.random() - 0.5) * self.ballVelNoise
+        ball_vx, ball_vy = self.ballVel[0][0] + (self.noiseRng.random() - 0.5) * self.ballVelNoise, -self.ballVel[0][1] + (self.noiseRng.random() - 0.5) * self.ballVelNoise
 
         # Simple camera model
         camPos = [ [ 100, 350 ],  [ 1100, 350 ]] # Camera position
@@ -112,12 +194,12 @@ class FuzbAISim:
             ra = [-ra[7-i] for i in range(8)]     
         
         cam1 = { "cameraID": 0, 
-                "ball_x": ball_x + camCorr[0][0] + (random.random() - 0.5) * self.ballPosNoise, "ball_y": ball_y + camCorr[0][1] + (random.random() - 0.5) * self.ballPosNoise, 
+                "ball_x": ball_x + camCorr[0][0] + (self.noiseRng.random() - 0.5) * self.ballPosNoise, "ball_y": ball_y + camCorr[0][1] + (self.noiseRng.random() - 0.5) * self.ballPosNoise, 
                 "ball_vx": ball_vx, "ball_vy": ball_vy, "ball_size": ballSize[0], 
                 "rod_position_calib": rp, "rod_angle": ra }
 
         cam2 = { "cameraID": 1, 
-                "ball_x": ball_x + camCorr[1][0] + (random.random() - 0.5) * self.ballPosNoise, "ball_y": ball_y + camCorr[1][1] + (random.random() - 0.5) * self.ballPosNoise, 
+                "ball_x": ball_x + camCorr[1][0] + (self.noiseRng.random() - 0.5) * self.ballPosNoise, "ball_y": ball_y + camCorr[1][1] + (self.noiseRng.random() - 0.5) * self.ballPosNoise, 
                 "ball_vx": ball_vx, "ball_vy": ball_vy, "ball_size": ballSize[1], 
                 "rod_position_calib": rp, "rod_angle": ra }
 
@@ -156,60 +238,150 @@ class FuzbAISim:
 
 
     def sampleCameras(self, t):
-        self.delayedMemory.append((t, self.getCameraDict(1), self.getCameraDict(2)))
+        self.camera.sample(t)
 
-        while len(self.delayedMemory) > 0 and t - self.delayedMemory[0][0] > self.maxMemory:
-            self.delayedMemory.pop(0)
+    def getDelayedFrame(self, t):
+        # Returns (capture time, camera for player 1, camera for player 2, frame ID, available time)
+        return self.camera.latestFrame(t + self.simulatedDelay)
 
     def getDelayedCamera(self, player, t):
-        if len(self.delayedMemory) == 0:
+        frame = self.getDelayedFrame(t)
+        if frame is None:
             return None
 
-        for i in range(len(self.delayedMemory)):
-            if self.delayedMemory[i][0] >= t:
-                return self.delayedMemory[i][player]
-    
-        # Return first (the oldest) by default
-        return self.delayedMemory[0][player]
+        return frame[player]
+
+    def checkGoal(self):
+        """
+        Counts a goal when the ball has fallen off the table and drops the ball back at the start location.
+        Returns the scoring team ("red" or "blue") or None.
+        """
+        if self.ballPos[2] >= 0.1:
+            return None
+
+        team = None
+
+        # Is the ball under the table?
+        if (self.ballPos[0] > 0 and self.ballPos[0] < 1.4 and self.ballPos[1] > 0 and self.ballPos[1] < 0.7):
+            # On which side?
+            if self.ballPos[0] < 0.72:
+                # Blue scored a goal
+                self.score[1] += 1
+                team = "blue"
+                print(f'Blue scored goal ({self.score[0]}:{self.score[1]})')
+            else:
+                # Red scored a goal
+                self.score[0] += 1
+                team = "red"
+                print(f'Red scored goal ({self.score[0]}:{self.score[1]})')
+
+            self.showScore()
+
+        # Reset the ball  
+        print("Dropping ball at start location")   
+        p.resetBasePositionAndOrientation(self.ball, self.defaultBallPos, p.getQuaternionFromEuler([0,0,0]))          
+        self.nudgeBall()
+        self.ballDropped = True
+
+        return team
 
     def nudgeBall(self):
         velocityNoise = 0.1
-        p.resetBaseVelocity(self.ball, linearVelocity=[random.random()*velocityNoise,random.random()*velocityNoise,0])
-
-    def applyMotorDeadband(self, i, newPos):    
-        motionDiff = newPos - self.prevRefPositions[i]
-
-        if motionDiff > self.motorDeadband and self.motionDirection[i] <= 0:
-            # Changed direction - forward
-            self.motionDirection[i] = 1
-        elif motionDiff < -self.motorDeadband and self.motionDirection[i] >= 0:
-            # Changed direction - backward
-            self.motionDirection[i] = -1
-        elif (self.motionDirection[i] >= 0 and motionDiff > 0) or (self.motionDirection[i] <= 0 and motionDiff < 0):
-            # Change nothing - motion in the same direction
-            pass    
-        else:
-            # Inside the deadband - ignore motion
-            return self.prevRefPositions[i]
+        p.resetBaseVelocity(self.ball, linearVelocity=[self.rng.random()*velocityNoise,self.rng.random()*velocityNoise,0])
+
+    def setPhysics(self, physics):
+        # Applies a physics parameter set (see DEFAULT_PHYSICS)
+        self.physics = physics
+        p.changeDynamics(self.ball, -1, **physics["ball"])
+        p.changeDynamics(self.mizaCollisionId, -1, **physics["table"])
+        self.actuators.setParameters(physics.get("actuator", {}))
 
-        self.prevRefPositions[i] = newPos
-        return newPos
+    def readRods(self):
+        # Rod states of all joints at once
+        self.rodAngles = [32 * js[0] / math.pi for js in p.getJointStates(self.mizaId, self.revJoints)]
+        self.rodPositions = [1 - 1000 * js[0] / self.travels[ji] for ji, js in enumerate(p.getJointStates(self.mizaId, self.slideJoints))]
 
-    def check_ball_contact(self):
+    def setState(self, ball=None, ballVelocity=None, rodPositions=None, rodAngles=None):
         """
-        Checks if the ball is in contact with any player rod.
-        Returns True if contact is detected, otherwise False.
+        Moves the ball and the rods directly, in camera coordinates of player 1
+        (ball in mm, velocity in m/s, calibrated rod positions and angles as in the camera data).
+        """
+        if ball is not None:
+            p.resetBasePositionAndOrientation(self.ball, [(ball[0] + 115) / 1000, (730 - ball[1]) / 1000, 0.1915], [0, 0, 0, 1])
+
+        if ballVelocity is not None:
+            # Already rolling, without sliding
+            vx, vy, r = ballVelocity[0], -ballVelocity[1], 0.0175
+            p.resetBaseVelocity(self.ball, [vx, vy, 0], [-vy / r, vx / r, 0])
+
+        for ji in range(8):
+            if rodPositions is not None:
+                p.resetJointState(self.mizaId, self.slideJoints[ji], (1 - rodPositions[ji]) * self.travels[ji] / 1000)
+            if rodAngles is not None:
+                p.resetJointState(self.mizaId, self.revJoints[ji], rodAngles[ji] * math.pi / 32)
+
+        self.ballPos, _ = p.getBasePositionAndOrientation(self.ball)
+        self.ballVel = p.getBaseVelocity(self.ball)
+        self.readRods()
+
+        # Hold the rods where they were put
+        if rodPositions is not None or rodAngles is not None:
+            self.actuators.reset([js[0] for js in p.getJointStates(self.mizaId, self.revJoints)],
+                                 [js[0] for js in p.getJointStates(self.mizaId, self.slideJoints)])
+
+    def updateContacts(self):
         """
-        CD0 = self.getCameraDict(1)["camData"][0]
-        bx, by = CD0["ball_x"], CD0["ball_y"]
+        Collects the ball contacts with the player figures, once per simulator update.
+        Every contact has the player link, its rod and team, the normal force and impulse,
+        the contact position and whether the contact started since the previous update.
 
-        # Check if the ball is close to any rod position
-        for rod in range(8):  # Assuming 8 rods in total
-            rod_y = 100 * rod  # Estimate rod position (adjust if needed)
-            if abs(by - rod_y) < 30:  # If ball is within 30 pixels of rod
-                return True
+        In the stepped mode an update follows every physics step. In the realtime mode Bullet steps
+        on its own, so the contacts are those of the latest step, the impulse covers the steps elapsed
+        since the previous update, and contacts shorter than an update can be missed.
+        """
+        previous = set(c["link"] for c in self.contacts)
+
+        steps = 1
+        if not self.stepped and self.contactTime is not None:
+            steps = max(round((self.t - self.contactTime) / self.timeStep), 1)
+        self.contactTime = self.t
+
+        contacts = {}
+        for cp in p.getContactPoints(bodyA=self.ball, bodyB=self.mizaId):
+            link = cp[4]
+            if link not in self.linkRods:
+                continue
+
+            # Several points of the same figure are merged into one contact
+            c = contacts.get(link)
+            if c is None:
+                rod, team = self.linkRods[link]
+                c = { "link": link, "rod": rod, "team": team, "normalForce": 0.0, "impulse": 0.0, "position": cp[6], "started": link not in previous }
+                contacts[link] = c
 
-        return False
+            c["normalForce"] += cp[9]
+            c["impulse"] += cp[9] * self.timeStep * steps
+
+        self.contacts = list(contacts.values())
+
+        if len(contacts) > 0:
+            with self.touchedLock:
+                self.touchedRods.update(c["rod"] for c in self.contacts)
+
+    def takeTouchedRods(self):
+        """
+        Returns the rods that touched the ball since the previous call and starts collecting anew.
+        """
+        with self.touchedLock:
+            touched, self.touchedRods = self.touchedRods, set()
+        return touched
+
+    def check_ball_contact(self, team=None):
+        """
+        Checks if the ball is in contact with any player (of the given team).
+        Returns True if contact is detected, otherwise False.
+        """
+        return any(team is None or c["team"] == team for c in self.contacts)
 
     def loadSimulator(self, printJointInfo = False):
         print("Loading simulator...")
@@ -253,7 +425,7 @@ class FuzbAISim:
                                             collisionFramePosition=shift,
                                             meshScale=meshScale)
 
-        mizaCollisionId = p.createMultiBody(baseMass=0,
+        self.mizaCollisionId = p.createMultiBody(baseMass=0,
                                             baseInertialFramePosition=[0, 0, 0],
                                             baseOrientation=p.getQuaternionFromEuler([math.pi/2,0,math.pi/2]),
                                             baseCollisionShapeIndex=collisionShapeId,
@@ -276,8 +448,7 @@ class FuzbAISim:
         p.changeVisualShape(self.ball, -1, rgbaColor=[1,1,0,1])
 
         # Adjust dynamics
-        p.changeDynamics(self.ball, -1, mass=0.0287, lateralFriction=0.2, rollingFriction=0.00005, spinningFriction=0.01, restitution=0.7, linearDamping=0)
-        p.changeDynamics(mizaCollisionId, -1, restitution=0.8)
+        p.changeDynamics(self.ball, -1, linearDamping=0)
 
         # Set player colors
         for rp in self.redPlayers:
@@ -288,9 +459,91 @@ class FuzbAISim:
 
         p.resetDebugVisualizerCamera(cameraDistance=1, cameraYaw=0,cameraPitch=-80, cameraTargetPosition=[0.72,0.375,0])
 
+        self.actuators = ActuatorModel(self.mizaId, self.revJoints, self.slideJoints, self.travels, 'actuator.json')
+        self.setPhysics(self.physics)
+
         # Enable realtime simulation
         p.setRealTimeSimulation(1)
-        p.setTimeStep(0.002)  # stability
+        p.setTimeStep(self.timeStep)  # stability
+
+    def updateState(self):
+        """
+        Bookkeeping at the start of every simulator update: ball state and contacts, goals,
+        dropping a stationary ball and the rod states.
+        """
+        self.ballPos, _ = p.getBasePositionAndOrientation(self.ball)
+        self.ballVel = p.getBaseVelocity(self.ball)
+        self.updateContacts()
+
+        self.checkGoal()
+
+        if math.sqrt(self.ballVel[0][0]**2 + self.ballVel[0][1]**2) > 0.05:
+            self.ballMovingTime = self.t
+
+        if self.t - self.ballMovingTime > 3 and self.autoBall:
+            # Ball is not moving - move it to a random location
+            print("Ball stationary, dropping to a random location")    
+            self.ballMovingTime = self.t
+            
+            p.resetBasePositionAndOrientation(self.ball, [0.718 + 0.6*self.rng.random(), 0.71 - self.rng.random()*0.7, 0.3], p.getQuaternionFromEuler([0,0,0]))
+            self.nudgeBall()
+            self.ballDropped = True
+
+        self.readRods()
+
+        self.stats.update(self.t, (1000*self.ballPos[0] - 115, 730 - 1000*self.ballPos[1], self.ballVel[0][0], -self.ballVel[0][1]),
+                          self.score, [c["rod"] for c in self.contacts], self.ballDropped)
+        self.ballDropped = False
+
+    def command(self, team, commands):
+        # Motor commands of a team, applied from the current simulator step (and recorded, see MatchLog.py)
+        if self.recorder is not None:
+            self.recorder.command(self.step, team, commands)
+        self.actuators.command(team, commands, self.t)
+        self.stats.command(0 if team == "red" else 1)
+
+    def dropBall(self):
+        # Moves the ball over the table (Enter in the GUI)
+        if self.recorder is not None:
+            self.recorder.event(self.step, "dropBall")
+        p.resetBasePositionAndOrientation(self.ball, self.defaultBallPos, p.getQuaternionFromEuler([0,0,0]))
+        self.ballDropped = True
+
+    def advance(self):
+        # One physics step of the stepped mode
+        p.stepSimulation()
+        self.step += 1
+        self.t = self.step * self.timeStep
+
+        if self.recorder is not None:
+            self.recorder.stepped(self)
+
+    def seed(self, seed):
+        # Random ball placement and camera noise, dropouts and latencies
+        self.rng = random.Random(seed)
+        self.noiseRng = random.Random(None if seed is None else seed + 1)
+        self.camera.rng = random.Random(None if seed is None else seed + 2)
+
+    def startRecording(self, fileName, seed=None, checksumInterval=50):
+        """
+        Records the match to a log (MatchLog.py) from the next step of the simulation loop.
+        """
+        self.recordRequest = ("start", fileName, seed, checksumInterval)
+
+    def stopRecording(self):
+        self.recordRequest = ("stop",)
+
+    def handleRecordRequest(self):
+        # Recording starts and stops in the simulation thread, between two steps
+        request, self.recordRequest = self.recordRequest, None
+
+        if self.recorder is not None:
+            self.recorder.close(self)
+            self.recorder = None
+
+        if request[0] == "start":
+            from MatchLog import MatchRecorder
+            self.recorder = MatchRecorder(self, *request[1:])
 
     def run(self):
         self.isRunning = True
@@ -301,11 +554,12 @@ class FuzbAISim:
         self.isRunning = False
 
     def __run(self):
-        t0 = time.time()
+        if self.stepped:
+            p.setRealTimeSimulation(0)
+        t0 = time.time() - self.t
 
-        refPos = 0
         prev_t = 0
-        ball_moving = 0
+        self.ballMovingTime = self.t
             
         print(f'\n*********************************\nStarting main loop\n*********************************\n')
 
@@ -317,80 +571,25 @@ class FuzbAISim:
 
         try:    
             while self.isRunning:    
-                self.ballPos, ballOrn = p.getBasePositionAndOrientation(self.ball)        
-                self.ballVel = p.getBaseVelocity(self.ball)
-
-                if self.ballPos[2] < 0.1:
-                    #print(ballPos)
-                    # Is the ball under the table?
-                    if (self.ballPos[0] > 0 and self.ballPos[0] < 1.4 and self.ballPos[1] > 0 and self.ballPos[1] < 0.7):
-                        # On which side?
-                        if self.ballPos[0] < 0.72:
-                            # Blue scored a goal
-                            self.score[1] += 1
-                            print(f'Blue scored goal ({self.score[0]}:{self.score[1]})')
-                        else:
-                            # Red scored a goal
-                            self.score[0] += 1
-                            print(f'Red scored goal ({self.score[0]}:{self.score[1]})')
-
-                        self.showScore()
-
-                    # Reset the ball  
-                    print("Dropping ball at start location")   
-                    p.resetBasePositionAndOrientation(self.ball, self.defaultBallPos, p.getQuaternionFromEuler([0,0,0]))          
-                    self.nudgeBall()
-                
-                self.t = time.time() - t0
-
-                if math.sqrt(self.ballVel[0][0]**2 + self.ballVel[0][1]**2) > 0.05:
-                    ball_moving = self.t
-
-                if self.t - ball_moving > 3:
-                    # Ball is not moving - move it to a random location
-                    print("Ball stationary, dropping to a random location")    
-                    ball_moving = self.t
-                    
-                    p.resetBasePositionAndOrientation(self.ball, [0.718 + 0.6*random.random(), 0.71 - random.random()*0.7, 0.3], p.getQuaternionFromEuler([0,0,0]))
-                    self.nudgeBall()
-
-                angles = []
-                rodPoses = []     
-                
-                for ji in range(8):        
-                    angles.append(32*p.getJointState(self.mizaId, self.revJoints[ji])[0] / math.pi)
-
-                # Linear...
-                for ji in range(8):                         
-                    rodPoses.append(1-1000*p.getJointState(self.mizaId, self.slideJoints[ji])[0] / self.travels[ji])
-                
-                self.rodPositions = rodPoses
-                self.rodAngles = angles
-
-                linVel = 1.5910861528058136
-                rotVel = 174.74649915501303
+                if self.recordRequest is not None:
+                    self.handleRecordRequest()
+
+                if not self.stepped:
+                    self.t = time.time() - t0
+
+                self.updateState()
 
                 # Process the agents...
                 if self.t - prev_t > 0.02:  
                     try:     
                         # process the rl-controlled agent
                         if self.status_player1 == 1:  # if using external control
-                            motors1 = self.motorcommandsexternal1  
+                            motors1 = self.motorCommandsExternal1  
                         else:
                             motors1 = self.p1.process_data(self.getDelayedCamera(1, self.t - self.simulatedDelay), np.random.uniform(-1, 1, (4,3)))
                             # print(f"Motors 1: {motors1}")
 
-                        drivemap = [0, 1, 3, 5]
-                        for m in motors1:
-                            axisID = drivemap[m["driveID"]-1]
-                            jId_rot = self.revJoints[axisID]
-                            jId_lin = self.slideJoints[axisID]
-
-                            refAngle = m["rotationTargetPosition"] * 2 * math.pi                
-                            p.setJointMotorControl2(self.mizaId, jId_rot, controlMode=p.POSITION_CONTROL, targetPosition=refAngle, force=2.0943448919793832, maxVelocity=rotVel*m["rotationVelocity"], positionGain=2.817867199313025, velocityGain=7.574019729635704)
-
-                            refPos = self.applyMotorDeadband(axisID, self.travels[axisID]*(m["translationTargetPosition"])/1000)
-                            p.setJointMotorControl2(self.mizaId, jId_lin, controlMode=p.POSITION_CONTROL, targetPosition=refPos, force=13.303989530423438, maxVelocity=linVel*m["translationVelocity"], positionGain=0.19343157707177333, velocityGain=3.9227062400839023)
+                        self.command("red", motors1)
                     except Exception as e:
                         print(f"exception in agent 1: {e}")
 
@@ -401,42 +600,14 @@ class FuzbAISim:
                         else:
                             motors2 = self.p2.process_data(self.getDelayedCamera(2, self.t - self.simulatedDelay), np.random.uniform(-1, 1, (4,3)))
 
-                        driveMap = [7, 6, 4, 2]                        
-                        for m in motors2:
-                            # print(f"Axis ID: {drivemap[m["driveID"]-1]}")
-                            axisID = driveMap[m["driveID"]-1]
-                            jId_rot = self.revJoints[axisID]
-                            jId_lin = self.slideJoints[axisID]
-
-                            refAngle = m["rotationTargetPosition"] * 2 * math.pi                
-                            p.setJointMotorControl2(self.mizaId, jId_rot, controlMode=p.POSITION_CONTROL, targetPosition=refAngle, force=2.0943448919793832, maxVelocity=rotVel*m["rotationVelocity"], positionGain=2.817867199313025, velocityGain=7.574019729635704)
-
-                            refPos = self.applyMotorDeadband(axisID, self.travels[axisID]*(m["translationTargetPosition"])/1000)
-                            p.setJointMotorControl2(self.mizaId, jId_lin, controlMode=p.POSITION_CONTROL, targetPosition=refPos, force=13.303989530423438, maxVelocity=linVel*m["translationVelocity"], positionGain=0.19343157707177333, velocityGain=3.9227062400839023)
-
-                        # if self.status_player2 == 0:             
-                        #     motors2 = self.p2.process_data(self.getDelayedCamera(2, self.t - self.simulatedDelay))
-                        # else:
-                        #     # Use the external motor data...
-                        #     motors2 = self.motorCommandsExternal2
-                        #     self.motorCommandsExternal2 = []        
-
-                        # driveMap = [7, 6, 4, 2]                        
-                        # for m in motors2:
-                        #     axisID = driveMap[m["driveID"]-1]
-                        #     jId_rot = self.revJoints[axisID]
-                        #     jId_lin = self.slideJoints[axisID]
-
-                        #     refAngle = -m["rotationTargetPosition"]*2*math.pi                
-                        #     p.setJointMotorControl2(self.mizaId, jId_rot, controlMode=p.POSITION_CONTROL, targetPosition=refAngle, force=2.0943448919793832, maxVelocity=rotVel*m["rotationVelocity"], positionGain=2.817867199313025, velocityGain=7.574019729635704)
-
-                        #     refPos = self.applyMotorDeadband(axisID, self.travels[axisID]*(m["translationTargetPosition"])/1000)
-                        #     p.setJointMotorControl2(self.mizaId, jId_lin, controlMode=p.POSITION_CONTROL, targetPosition=refPos, force=13.303989530423438, maxVelocity=linVel*m["translationVelocity"], positionGain=0.19343157707177333, velocityGain=3.9227062400839023)
+                        self.command("blue", motors2)
                     except Exception as e:
                         print(f"Exception in agent 2: {e}")
 
                     prev_t = self.t        
 
+                self.actuators.update(self.t)
+
                 self.sampleCameras(self.t)
                 #print("States: ", rodPositions, rodAngles)
                 #print(p.getLinkState(mizaId, 3))
@@ -446,7 +617,7 @@ class FuzbAISim:
                     for k, v in keys.items():        
                         if (k == 65309 and (v & p.KEY_WAS_TRIGGERED)): # 65309 == enter
                             # Move the ball over the table
-                            p.resetBasePositionAndOrientation(self.ball, self.defaultBallPos, p.getQuaternionFromEuler([0,0,0]))
+                            self.dropBall()
                         if (k == 32): # Esc
                             running = False 
                             break            
@@ -466,6 +637,21 @@ class FuzbAISim:
                 if len(keys) > 0:
                     prev_key_t = self.t
 
+                if self.stepped:
+                    self.advance()
+
+                    # Keep pace with the wall clock
+                    delay = t0 + self.t - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+            if self.recorder is not None:
+                self.recorder.close(self)
+                self.recorder = None
+
+            if self.statsFile is not None:
+                self.stats.dump(self.statsFile)
+
             print("Stopping simulation...")
             p.disconnect()
             print("Stopping server...")
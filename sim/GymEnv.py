@@ -2,12 +2,18 @@ import gym
 from gym import spaces
 import numpy as np
 from FuzbAISim import FuzbAISim
+from FuzbAIAgent_Example import PlayerAgentRL
+from RewardEngine import RewardEngine
 import time
 
 class FoosballEnv(gym.Env):
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, scenarios=None):
         super(FoosballEnv, self).__init__()
-        self.sim = FuzbAISim(debug=debug)
+        # Stepped mode: the simulator thread sees every physics step (contacts for the drills and rewards)
+        self.sim = FuzbAISim(debug=debug, stepped=True)
+
+        # Drills (Scenarios.py): every episode starts from a sampled drill and ends with its outcome
+        self.scenarios = scenarios
         self.episode_reward = 0  # Track episode rewards
 
         self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(8, 3), dtype=np.float32)
@@ -18,16 +24,43 @@ class FoosballEnv(gym.Env):
         self.prev_rod_positions = np.zeros(4)
         self.prev_rod_angles = np.zeros(4)
 
+        # Reward terms (RewardEngine.py) and the state they are computed from
+        self.rewards = RewardEngine()
+        self.reward_state = { "obs": np.zeros((1, 20)), "contacts": np.zeros((1, 2), dtype=bool), "goals": np.zeros((1, 2)) }
+
+        # Self-play opponent (SelfPlay.py), loaded in the background when first requested
+        self.opponents = None
+        self.prev_score = list(self.sim.score)
+
+        # The learner's actions become motor commands of its teams through agents owned by the environment
+        # (the simulator thread runs sim.p1/sim.p2 only for the self-play opponent)
+        self.learners = [PlayerAgentRL(team="red"), PlayerAgentRL(team="blue")]
+        self.sim.status_player1 = 1
+        self.sim.status_player2 = 1
+
         self.sim.run()
 
+    def setOpponent(self, name, path, team="blue"):
+        """
+        Plays team with a snapshot from the self-play pool. The snapshot is swapped in when loaded,
+        the previous opponent plays until then.
+        """
+        if self.opponents is None:
+            from SelfPlay import OpponentLoader
+            self.opponents = OpponentLoader(self.sim)
+
+        self.opponents.request(name, path, team)
+
     def _get_obs(self):
         """
         Returns the current state of the environment, ensuring the expected shape.
         """
         try:
-            camData = self.sim.getCameraDict(1)
+            # Observe what the cameras deliver (frame rate, latency, dropouts), not the exact state
+            # (no frame yet right after a drill has been placed - use the current state)
+            camData = self.sim.getDelayedCamera(1, self.sim.t - self.sim.simulatedDelay) or self.sim.getCameraDict(1)
 
-            if "camData" not in camData or not camData["camData"]:
+            if camData is None or "camData" not in camData or not camData["camData"]:
                 print("[ERROR] Camera data is missing! Returning default observation.")
                 return np.zeros(self.observation_space.shape, dtype=np.float32)
 
@@ -50,39 +83,26 @@ class FoosballEnv(gym.Env):
 
 
 
-    def _compute_reward(self, team):
+    def _compute_reward(self):
         """
-        Computes the reward for the agent based on gameplay and movement smoothness.
+        Computes the rewards of both teams with the reward engine (terms and weights in reward.json).
+        Returns the red and blue reward, the contribution of every term and the goals scored since the last step.
         """
-        camData = self.sim.getCameraDict(1)
-        bx, by, vx, vy = camData["camData"][0]["ball_x"], camData["camData"][0]["ball_y"], camData["camData"][0]["ball_vx"], camData["camData"][0]["ball_vy"]
-
-        reward = 0  
-
-        # Reward for movement (encourages active play)
-        avg_velocity = np.mean([abs(vx), abs(vy)])
-        reward += avg_velocity * 0.2  
+        CD0 = self.sim.getCameraDict(1)["camData"][0]
+        obs = self.reward_state["obs"]
+        obs[0, 0:4] = [CD0["ball_x"], CD0["ball_y"], CD0["ball_vx"], CD0["ball_vy"]]
+        obs[0, 4:12] = CD0.get("rod_position_calib", obs[0, 4:12])
+        obs[0, 12:20] = CD0.get("rod_angle", obs[0, 12:20])
 
-        # Reward for positioning rods near the ball
-        for rod in self.sim.p1.rods if team == "red" else self.sim.p2.rods:
-            rod_y = 100 * rod
-            reward += 0.1 - abs(by - rod_y) / 350  
+        self.reward_state["contacts"][0] = [self.sim.check_ball_contact("red"), self.sim.check_ball_contact("blue")]
 
-        # Reward for moving the ball toward the opponent’s goal
-        if team == "red" and vx > 0:  
-            reward += 0.5  
-        elif team == "blue" and vx < 0:
-            reward += 0.5  
+        score = list(self.sim.score)
+        goals = [score[0] - self.prev_score[0], score[1] - self.prev_score[1]]
+        self.reward_state["goals"][0] = goals
+        self.prev_score = score
 
-        # Reward for making contact with the ball
-        if self.sim.check_ball_contact():
-            reward += 1.0  
-
-        # Small penalty for stopping too much
-        if avg_velocity < 0.05:
-            reward -= 0.1  
-
-        return float(reward)
+        rewards, terms = self.rewards.compute(self.reward_state)
+        return float(rewards[0, 0]), float(rewards[0, 1]), { name: value[0].tolist() for name, value in terms.items() }, goals
 
     def step(self, action):
         """
@@ -98,17 +118,24 @@ class FoosballEnv(gym.Env):
             print(f"[ERROR] Action shape mismatch! Expected (8,3), got {action.shape}")
             action = np.zeros((8, 3))  
 
-        camera_data = self.sim.getCameraDict(1)
-
-        actions_p1 = action[:4]
-        actions_p2 = action[4:]
-
-        commands_p1 = self.sim.p1.process_data(camera_data, actions_p1)
-        commands_p2 = self.sim.p2.process_data(camera_data, actions_p2)
-
-        # ✅ Assign the RL-generated motor commands
-        self.sim.motorCommandsExternal1 = commands_p1  
-        self.sim.motorCommandsExternal2 = commands_p2  
+        opponent = self.opponents.current if self.opponents is not None else None
+
+        # ✅ Assign the RL-generated motor commands of the learner's teams, each from its own camera;
+        # the opponent's team is left to its agent in the simulator thread
+        for player, team, actions in ((1, "red", action[:4]), (2, "blue", action[4:])):
+            external = opponent is None or opponent[1] != team
+            if external:
+                camera_data = self.sim.getDelayedCamera(player, self.sim.t - self.sim.simulatedDelay) or self.sim.getCameraDict(player)
+                commands = self.learners[player - 1].process_data(camera_data, actions)
+
+            if player == 1:
+                if external:
+                    self.sim.motorCommandsExternal1 = commands
+                self.sim.status_player1 = 1 if external else 0
+            else:
+                if external:
+                    self.sim.motorCommandsExternal2 = commands
+                self.sim.status_player2 = 1 if external else 0
 
         # print(f"[DEBUG] RL Actions Applied to motorCommandsExternal1: {self.sim.motorCommandsExternal1}")
         # print(f"[DEBUG] RL Actions Applied to motorCommandsExternal2: {self.sim.motorCommandsExternal2}")
@@ -116,16 +143,34 @@ class FoosballEnv(gym.Env):
         time.sleep(0.02)
 
         # ✅ Compute separate rewards for both players
-        reward_p1 = self._compute_reward("red")
-        reward_p2 = self._compute_reward("blue")
+        reward_p1, reward_p2, reward_terms, goals = self._compute_reward()
 
         # ✅ Return rewards as a NumPy array instead of a list
         # reward = np.array([reward_p1, reward_p2], dtype=np.float32).flatten()  # Fix for ValueError
         total_reward = float(reward_p1 + reward_p2) 
 
+        info = { "rewardTerms": reward_terms }
+        if opponent is not None:
+            name, team = opponent
+
+            # Only the learner's team is rewarded
+            total_reward = float(reward_p2 if team == "red" else reward_p1)
+
+            # Goals since the last step, from the view of the opponent
+            if team == "blue":
+                goals = goals[::-1]
+            if goals[0] != 0 or goals[1] != 0:
+                info["selfPlay"] = { "opponent": name, "result": int(np.sign(goals[0] - goals[1])) }
+
         done = False  
 
-        return self._get_obs(), total_reward, done, {}
+        if self.scenarios is not None:
+            outcome = self.scenarios.check(self.sim, self.sim.t)
+            if outcome is not None:
+                info["scenario"] = { "name": self.scenarios.drill["name"], "outcome": outcome }
+                done = True
+
+        return self._get_obs(), total_reward, done, info
 
 
     def reset(self):
@@ -139,6 +184,10 @@ class FoosballEnv(gym.Env):
         #     print("[DEBUG] Resetting the existing simulation...")
         #     self.sim.reset()
 
+        if self.scenarios is not None:
+            # Next drill, placed directly without reloading the simulator
+            self.scenarios.start(self.sim, self.sim.t)
+
         obs = self._get_obs()  # Get initial state
 
         if obs is None:
@@ -148,5 +197,6 @@ class FoosballEnv(gym.Env):
         print(f"[DEBUG] Reset() returning observation with shape {obs.shape}: {obs}")
 
         self.episode_reward = 0  # Reset reward tracking
+        self.prev_score = list(self.sim.score)
         
         return obs  # Must return an observation
@@ -0,0 +1,192 @@
+import argparse
+import multiprocessing
+import threading
+import time
+import numpy as np
+from multiprocessing.connection import Listener, Client, wait
+
+# Batched policy inference for many simulated tables.
+#
+# Every table (a FoosballEnv in its own process) sends its observation to the server and waits for
+# the action. The server collects the requests until all connected tables are waiting, maxBatch
+# requests are queued or the oldest request has waited for deadline seconds, runs the policy once on
+# the stacked observations and sends every table its row of the result.
+#
+# The transport is multiprocessing.connection (Unix socket or named pipe on the local machine).
+#
+#   python InferenceServer.py foosball_agent --tables 64
+
+class InferenceMetrics:
+    def __init__(self, window=10000):
+        self.window = window
+        self.batches = 0
+        self.requests = 0
+        self.inferenceTime = 0
+        self.batchSizes = []
+        self.queueDelays = []
+
+    def record(self, batchSize, queueDelays, inferenceTime):
+        self.batches += 1
+        self.requests += batchSize
+        self.inferenceTime += inferenceTime
+
+        # Distributions are kept for the latest requests only
+        self.batchSizes.append(batchSize)
+        self.queueDelays.extend(queueDelays)
+        del self.batchSizes[:-self.window]
+        del self.queueDelays[:-self.window]
+
+    def summary(self):
+        if self.batches == 0:
+            return { "batches": 0, "requests": 0 }
+
+        delays = np.array(self.queueDelays) * 1000
+        return { "batches": self.batches, "requests": self.requests,
+                 "batchSizeMean": float(np.mean(self.batchSizes)), "batchSizeMax": int(np.max(self.batchSizes)),
+                 "queueDelayMs": { "mean": float(delays.mean()), "p50": float(np.percentile(delays, 50)),
+                                   "p95": float(np.percentile(delays, 95)), "p99": float(np.percentile(delays, 99)) },
+                 "inferenceMsPerBatch": 1000 * self.inferenceTime / self.batches }
+
+class InferenceServer:
+    def __init__(self, policy, address=None, authkey=b'fuzbai', maxBatch=64, deadline=0.002):
+        # policy: function from an observation matrix (batch, ...) to an action matrix (batch, ...)
+        self.policy = policy
+        self.maxBatch = maxBatch
+        self.deadline = deadline
+
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+        self.connections = []
+        self.lock = threading.Lock()
+        self.isRunning = False
+
+        self.metrics = InferenceMetrics()
+
+    def acceptConnections(self):
+        while self.isRunning:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break
+
+            with self.lock:
+                self.connections.append(conn)
+
+    def stop(self):
+        self.isRunning = False
+        self.listener.close()
+
+    def serve(self):
+        self.isRunning = True
+        threading.Thread(target=self.acceptConnections, daemon=True).start()
+
+        # Queued requests as (connection, observation, arrival time)
+        pending = []
+
+        while self.isRunning:
+            with self.lock:
+                connections = list(self.connections)
+
+            waiting = set(id(c) for c, _, _ in pending)
+            idle = [c for c in connections if id(c) not in waiting]
+
+            if len(pending) > 0:
+                timeout = max(pending[0][2] + self.deadline - time.perf_counter(), 0)
+            else:
+                timeout = 0.1
+
+            if len(idle) > 0:
+                ready = wait(idle, timeout)
+            else:
+                time.sleep(timeout)
+                ready = []
+
+            for conn in ready:
+                try:
+                    pending.append((conn, conn.recv(), time.perf_counter()))
+                except (EOFError, OSError):
+                    # Table closed the connection
+                    with self.lock:
+                        self.connections.remove(conn)
+                    connections.remove(conn)
+
+            if len(pending) == 0:
+                continue
+
+            if len(pending) >= self.maxBatch or len(pending) >= len(connections) or time.perf_counter() >= pending[0][2] + self.deadline:
+                batch = pending[:self.maxBatch]
+                pending = pending[self.maxBatch:]
+                self.dispatch(batch)
+
+    def dispatch(self, batch):
+        t0 = time.perf_counter()
+        actions = self.policy(np.stack([obs for _, obs, _ in batch]))
+        inferenceTime = time.perf_counter() - t0
+
+        for (conn, _, _), action in zip(batch, actions):
+            try:
+                conn.send(action)
+            except OSError:
+                pass
+
+        self.metrics.record(len(batch), [t0 - arrival for _, _, arrival in batch], inferenceTime)
+
+class InferenceClient:
+    def __init__(self, address, authkey=b'fuzbai'):
+        self.conn = Client(address, authkey=authkey)
+
+    def act(self, obs):
+        self.conn.send(np.asarray(obs, dtype=np.float32))
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+def loadPolicy(fileName):
+    # Trained stable-baselines3 SAC model (train.py) as a batched policy
+    from stable_baselines3 import SAC
+    model = SAC.load(fileName, device="cpu")
+    return lambda obs: model.predict(obs, deterministic=True)[0]
+
+def runTable(address, steps):
+    # One simulated table, controlled through the inference server
+    from GymEnv import FoosballEnv
+
+    env = FoosballEnv(debug=False)
+    client = InferenceClient(address)
+
+    obs = env.reset()
+    for _ in range(steps):
+        obs, reward, done, info = env.step(client.act(obs))
+        if done:
+            obs = env.reset()
+
+    client.close()
+    env.sim.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='FuzbAI inference server')
+    parser.add_argument('model', help='Trained model (train.py)')
+    parser.add_argument('--tables', type=int, default=64, help='Number of simulated tables (processes)')
+    parser.add_argument('--steps', type=int, default=1000, help='Steps per table')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--deadline', type=float, default=0.002, help='Maximal queueing delay of a request (s)')
+    args = parser.parse_args()
+
+    server = InferenceServer(loadPolicy(args.model), maxBatch=args.max_batch, deadline=args.deadline)
+    serverThread = threading.Thread(target=server.serve)
+    serverThread.start()
+
+    # Tables are started fresh (not forked from this multithreaded process)
+    context = multiprocessing.get_context("spawn")
+    tables = [context.Process(target=runTable, args=(server.address, args.steps)) for _ in range(args.tables)]
+    for t in tables:
+        t.start()
+    for t in tables:
+        t.join()
+
+    server.stop()
+    serverThread.join()
+
+    print(server.metrics.summary())
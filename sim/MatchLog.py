@@ -0,0 +1,203 @@
+import argparse
+import json
+import random
+import time
+import zlib
+import numpy as np
+import pybullet as p
+
+# Deterministic recording and replay of matches.
+#
+# Recording needs the stepped mode of the simulator (FuzbAISim(stepped=True)): physics advances in fixed
+# steps, the random generators are seeded and commands are applied at step boundaries, whatever thread
+# they came from. The log (JSON lines) holds:
+#   header:    seed, time step, physics parameters and the initial state (ball, joints, score)
+#   commands:  every motor command applied to the actuators, with its step
+#   events:    ball drops requested from outside the simulation loop
+#   checksums: CRC of the physics state every checksumInterval steps
+#
+# Replay re-executes the log in a headless simulator as fast as possible and compares the checksums.
+#
+#   python MatchLog.py record match.jsonl --duration 60 [--seed 1] [--red-policy policy.npz]
+#   python MatchLog.py replay match.jsonl
+
+FORMAT = 1
+
+def captureState(sim):
+    # Ball pose and velocity, positions and velocities of all rod joints
+    pos, orn = p.getBasePositionAndOrientation(sim.ball)
+    lin, ang = p.getBaseVelocity(sim.ball)
+    joints = p.getJointStates(sim.mizaId, sim.revJoints + sim.slideJoints)
+    return { "ball": [list(pos), list(orn), list(lin), list(ang)], "joints": [[js[0], js[1]] for js in joints] }
+
+def applyState(sim, state):
+    # Puts the simulator into a captured state, with fresh actuator, camera and contact state
+    pos, orn, lin, ang = state["ball"]
+    p.resetBasePositionAndOrientation(sim.ball, pos, orn)
+    p.resetBaseVelocity(sim.ball, lin, ang)
+    for joint, (q, v) in zip(sim.revJoints + sim.slideJoints, state["joints"]):
+        p.resetJointState(sim.mizaId, joint, q, v)
+
+    n = len(sim.revJoints)
+    sim.actuators.reset([q for q, _ in state["joints"][:n]], [q for q, _ in state["joints"][n:]])
+    sim.camera.reset(sim.t)
+    sim.contacts = []
+
+def checksum(sim):
+    pos, orn = p.getBasePositionAndOrientation(sim.ball)
+    lin, ang = p.getBaseVelocity(sim.ball)
+    joints = p.getJointStates(sim.mizaId, sim.revJoints + sim.slideJoints)
+    values = np.array(list(pos) + list(orn) + list(lin) + list(ang) + [x for js in joints for x in js[:2]], dtype=np.float64)
+    return f"{zlib.crc32(values.tobytes()):08x}"
+
+class MatchRecorder:
+    # Started and written from the simulation thread (FuzbAISim.startRecording)
+    def __init__(self, sim, fileName, seed=None, checksumInterval=50):
+        if not sim.stepped:
+            raise ValueError("Recording requires the stepped mode (FuzbAISim(stepped=True))")
+
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**31)
+
+        self.interval = checksumInterval
+        self.file = open(fileName, 'w')
+
+        sim.seed(seed)
+        state = captureState(sim)
+        applyState(sim, state)
+
+        self.write({ "format": FORMAT, "seed": seed, "timeStep": sim.timeStep, "step": sim.step, "t": sim.t,
+                     "ballMovingTime": sim.ballMovingTime, "score": list(sim.score), "autoBall": sim.autoBall,
+                     "physics": sim.physics, "checksumInterval": checksumInterval, "state": state })
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def command(self, step, team, commands):
+        self.write({ "step": step, "team": team, "commands": commands })
+
+    def event(self, step, name):
+        self.write({ "step": step, "event": name })
+
+    def stepped(self, sim):
+        if sim.step % self.interval == 0:
+            pos = sim.ballPos
+            self.write({ "step": sim.step, "checksum": checksum(sim), "ball": list(pos) if pos is not None else None })
+
+    def close(self, sim):
+        self.write({ "step": sim.step, "end": True, "score": list(sim.score) })
+        self.file.close()
+
+def readLog(fileName):
+    with open(fileName) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    header = records[0]
+    if header.get("format") != FORMAT:
+        raise ValueError(f"Unsupported match log format in {fileName}")
+
+    return header, records[1:]
+
+def replay(fileName, stopOnMismatch=False):
+    # Re-executes a match log, returns the verification result
+    from FuzbAISim import FuzbAISim
+
+    header, records = readLog(fileName)
+
+    commands = {}
+    events = {}
+    checksums = {}
+    end = None
+    for r in records:
+        if "commands" in r:
+            commands.setdefault(r["step"], []).append((r["team"], r["commands"]))
+        elif "event" in r:
+            events.setdefault(r["step"], []).append(r["event"])
+        elif "checksum" in r:
+            checksums[r["step"]] = r
+        elif r.get("end"):
+            end = r
+
+    lastStep = end["step"] if end is not None else max([header["step"]] + [r["step"] for r in records])
+
+    sim = FuzbAISim(seed=header["seed"], stepped=True)
+    p.setRealTimeSimulation(0)
+    p.setTimeStep(header["timeStep"])
+    sim.timeStep = header["timeStep"]
+    sim.setPhysics(header["physics"])
+
+    sim.step = header["step"]
+    sim.t = header["t"]
+    sim.ballMovingTime = header["ballMovingTime"]
+    sim.score = list(header["score"])
+    sim.autoBall = header["autoBall"]
+    sim.seed(header["seed"])
+    applyState(sim, header["state"])
+
+    mismatches = []
+    t0 = time.time()
+
+    # Same order of operations as the simulation loop
+    while sim.step < lastStep:
+        sim.updateState()
+
+        for team, c in commands.get(sim.step, []):
+            sim.command(team, c)
+
+        sim.actuators.update(sim.t)
+
+        for e in events.get(sim.step, []):
+            if e == "dropBall":
+                sim.dropBall()
+
+        sim.advance()
+
+        expected = checksums.get(sim.step)
+        if expected is not None and checksum(sim) != expected["checksum"]:
+            mismatches.append({ "step": sim.step, "expectedBall": expected["ball"], "ball": list(p.getBasePositionAndOrientation(sim.ball)[0]) })
+            if stopOnMismatch:
+                break
+
+    elapsed = time.time() - t0
+    simulated = (sim.step - header["step"]) * sim.timeStep
+
+    return { "steps": sim.step - header["step"], "checksums": len(checksums), "mismatches": mismatches, "statistics": sim.stats.summary(),
+             "score": sim.score, "expectedScore": end["score"] if end is not None else None,
+             "elapsed": elapsed, "speedup": simulated / elapsed if elapsed > 0 else None }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='FuzbAI match log')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('log', help='Match log (.jsonl)')
+    parser.add_argument('--duration', type=float, default=60, help='Length of the recorded match (s)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--checksum-interval', type=int, default=50, help='Steps between state checksums')
+    parser.add_argument('--red-policy', help='Exported policy of the red player (.npz, PolicyAgent.py)')
+    parser.add_argument('--blue-policy', help='Exported policy of the blue player (.npz, PolicyAgent.py)')
+    parser.add_argument('--stop', action='store_true', help='Stop replaying at the first mismatch')
+    parser.add_argument('--stats', help='Write the match statistics (MatchStats.py) to this file')
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        from FuzbAISim import FuzbAISim
+
+        sim = FuzbAISim(redPolicy=args.red_policy, bluePolicy=args.blue_policy, stepped=True)
+        sim.startRecording(args.log, args.seed, args.checksum_interval)
+        sim.statsFile = args.stats
+        sim.run()
+        time.sleep(args.duration)
+        sim.stop()
+        sim.simThread.join()
+        print(f"Recorded {sim.step} steps, score {sim.score[0]}:{sim.score[1]}")
+    else:
+        result = replay(args.log, args.stop)
+        print(f"Replayed {result['steps']} steps in {result['elapsed']:.1f} s ({result['speedup']:.1f}x realtime), "
+              f"score {result['score']} (recorded {result['expectedScore']})")
+        if args.stats:
+            with open(args.stats, 'w') as f:
+                json.dump(result["statistics"], f)
+
+        if len(result["mismatches"]) > 0:
+            print(f"{len(result['mismatches'])} of {result['checksums']} checksums differ, first at step {result['mismatches'][0]['step']}")
+        else:
+            print(f"All {result['checksums']} checksums match")
@@ -0,0 +1,163 @@
+import numpy as np
+
+# Built-in agent running a trained policy without torch. Keep this file identical in sim/ and wrapper/src/.
+#
+# The actor network of a stable-baselines3 SAC model (train.py) is exported to a .npz file: the weights
+# and biases of its linear layers (ReLU between them, tanh at the output). Observation normalization
+# (VecNormalize) is folded into the first layer, its clipping becomes the obsLow/obsHigh bounds of the raw
+# observation. At runtime the network is evaluated with NumPy into preallocated buffers.
+#
+#   python PolicyAgent.py foosball_agent foosball_agent.npz [--normalize vecnormalize.pkl]
+#
+# The observation is the one of FoosballEnv (ball x, y, vx, vy, 8 rod positions, 8 rod angles) and the
+# policy outputs (translation, rotation, velocity) for 8 drives, of which 4 are used by the agent:
+#   perspective "table": observation as seen by the red player, red uses rows 0-3 and blue rows 4-7 (as in FoosballEnv)
+#   perspective "own":   observation as seen by the agent's own player, rows 0-3 (policy plays from its own side)
+
+FORMAT = 1
+
+class PolicyAgent:
+    def __init__(self, fileName, team="red", perspective="table"):
+        self.team = team
+        self.perspective = perspective
+
+        data = np.load(fileName)
+        if int(data["format"]) != FORMAT:
+            raise ValueError(f"Unsupported policy format in {fileName}")
+
+        layers = int(data["layers"])
+        self.weights = [np.ascontiguousarray(data[f"weights_{i}"], dtype=np.float32) for i in range(layers)]
+        self.biases = [np.ascontiguousarray(data[f"biases_{i}"], dtype=np.float32) for i in range(layers)]
+        self.obsLow = data["obsLow"].astype(np.float32)
+        self.obsHigh = data["obsHigh"].astype(np.float32)
+        self.actionLow = data["actionLow"].astype(np.float32).ravel()
+        self.actionHigh = data["actionHigh"].astype(np.float32).ravel()
+
+        # Preallocated buffers for the observation and every layer output
+        self.obs = np.zeros(self.weights[0].shape[1], dtype=np.float32)
+        self.outputs = [np.zeros(w.shape[0], dtype=np.float32) for w in self.weights]
+        self.action = np.zeros(self.outputs[-1].shape, dtype=np.float32)
+
+        if perspective == "table" and team == "blue":
+            self.rows = slice(4, 8)
+        else:
+            self.rows = slice(0, 4)
+
+        self.reset()
+
+    def reset(self):
+        # Smoothed targets of the 4 drives
+        self.translation = np.full(4, 0.5)
+        self.rotation = np.zeros(4)
+
+    def observe(self, camera):
+        CD0 = camera["camData"][0]
+        obs = self.obs
+        rp = CD0["rod_position_calib"]
+        ra = CD0["rod_angle"]
+
+        if self.perspective == "table" and self.team == "blue":
+            # The blue player gets the reversed field, turn it back
+            obs[0:4] = [1210 - CD0["ball_x"], 700 - CD0["ball_y"], -CD0["ball_vx"], -CD0["ball_vy"]]
+            obs[4:12] = [1 - rp[7-i] for i in range(8)]
+            obs[12:20] = [-ra[7-i] for i in range(8)]
+        else:
+            obs[0:4] = [CD0["ball_x"], CD0["ball_y"], CD0["ball_vx"], CD0["ball_vy"]]
+            obs[4:12] = rp
+            obs[12:20] = ra
+
+        return obs
+
+    def forward(self, obs):
+        # Actions (rows of translation, rotation, velocity) in [actionLow, actionHigh]
+        x = np.clip(obs, self.obsLow, self.obsHigh, out=obs)
+
+        last = len(self.weights) - 1
+        for i, (w, b, out) in enumerate(zip(self.weights, self.biases, self.outputs)):
+            np.dot(w, x, out=out)
+            out += b
+            if i < last:
+                np.maximum(out, 0, out=out)
+            x = out
+
+        np.tanh(x, out=self.action)
+        self.action += 1
+        self.action *= 0.5 * (self.actionHigh - self.actionLow)
+        self.action += self.actionLow
+
+        return self.action.reshape(-1, 3)
+
+    def process_data(self, camera, rl_action=None):
+        if camera is None:
+            return []
+
+        actions = self.forward(self.observe(camera))[self.rows]
+
+        # Same mapping of actions to motor commands as PlayerAgentRL
+        self.translation = 0.9 * self.translation + 0.1 * (0.5 + actions[:, 0] * 0.5)
+        self.rotation = 0.9 * self.rotation + 0.1 * (actions[:, 1] * 0.75)
+        velocity = np.clip(actions[:, 2] * 1.5, 0.1, 2.0)
+
+        translation = np.clip(self.translation, 0, 1)
+        rotation = np.clip(self.rotation, -1, 1)
+
+        return [{ "driveID": i + 1,
+                  "rotationTargetPosition": float(rotation[i]), "rotationVelocity": float(velocity[i]),
+                  "translationTargetPosition": float(translation[i]), "translationVelocity": float(velocity[i]) } for i in range(4)]
+
+def exportPolicy(modelFile, outFile, normalizeFile=None):
+    # Exports the actor of a saved stable-baselines3 SAC model (and optionally its VecNormalize statistics)
+    import pickle
+    from stable_baselines3 import SAC
+
+    normalize = None
+    if normalizeFile is not None:
+        with open(normalizeFile, 'rb') as f:
+            normalize = pickle.load(f)
+
+    exportModel(SAC.load(modelFile, device="cpu"), outFile, normalize)
+
+def exportModel(model, outFile, normalize=None):
+    # Exports the actor of a loaded SAC model, normalize is its VecNormalize environment (or None)
+    import torch
+
+    actor = model.policy.actor
+    if actor.use_sde:
+        raise ValueError("Policies with gSDE are not supported")
+
+    linear = [m for m in actor.latent_pi if isinstance(m, torch.nn.Linear)] + [actor.mu]
+    weights = [m.weight.detach().cpu().numpy().astype(np.float64) for m in linear]
+    biases = [m.bias.detach().cpu().numpy().astype(np.float64) for m in linear]
+
+    obsDim = weights[0].shape[1]
+    obsLow = np.full(obsDim, -np.inf)
+    obsHigh = np.full(obsDim, np.inf)
+
+    if normalize is not None:
+        # (obs - mean) / std clipped to +-clip  ==  raw obs clipped to mean +- clip*std, then scaled in the first layer
+        mean = normalize.obs_rms.mean
+        std = np.sqrt(normalize.obs_rms.var + normalize.epsilon)
+        obsLow = mean - normalize.clip_obs * std
+        obsHigh = mean + normalize.clip_obs * std
+
+        biases[0] = biases[0] - weights[0] @ (mean / std)
+        weights[0] = weights[0] / std
+
+    arrays = { "format": FORMAT, "layers": len(linear), "obsLow": obsLow, "obsHigh": obsHigh,
+               "actionLow": model.action_space.low, "actionHigh": model.action_space.high }
+    for i in range(len(linear)):
+        arrays[f"weights_{i}"] = weights[i]
+        arrays[f"biases_{i}"] = biases[i]
+
+    np.savez(outFile, **arrays)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='FuzbAI policy export')
+    parser.add_argument('model', help='Trained model (train.py)')
+    parser.add_argument('output', help='Exported policy (.npz)')
+    parser.add_argument('--normalize', help='VecNormalize statistics of the training environment')
+    args = parser.parse_args()
+
+    exportPolicy(args.model, args.output, args.normalize)
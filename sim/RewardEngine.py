@@ -0,0 +1,134 @@
+import json
+import os
+import numpy as np
+
+# Reward terms evaluated for a batch of states and both teams at once.
+#
+# A state batch is a dict of arrays with N rows:
+#   obs:      (N, 20) ball x, y (mm), vx, vy (m/s), 8 rod positions, 8 rod angles, as seen by the red player
+#   contacts: (N, 2)  ball touched by a red / blue figure
+#   goals:    (N, 2)  goals scored by red / blue since the previous state
+# FoosballEnv builds a batch of one row per step, batched simulators (SurrogateSim.observe) can pass all tables.
+#
+# The terms and their weights are listed in reward.json, a term with weight 0 is not evaluated.
+# New terms are registered with @term("name"): a function (engine, state, params) returning an (N, 2)
+# array, the unweighted value of the term for red and blue.
+
+DEFAULT_CONFIG = {
+    "terms": {
+        "ballSpeed": { "weight": 0.2 },
+        "rodNearBall": { "weight": 1.0 },
+        "ballDirection": { "weight": 0.5 },
+        "contact": { "weight": 1.0 },
+        "stall": { "weight": -0.1, "threshold": 0.05 },
+        "goal": { "weight": 0.0 }
+    }
+}
+
+TERMS = {}
+
+def term(name):
+    def register(f):
+        TERMS[name] = f
+        return f
+    return register
+
+def ballSpeed(state):
+    obs = state["obs"]
+    return 0.5 * (np.abs(obs[:, 2]) + np.abs(obs[:, 3]))
+
+@term("ballSpeed")
+def ballSpeedTerm(engine, state, params):
+    speed = ballSpeed(state)
+    return np.stack([speed, speed], axis=1)
+
+@term("rodNearBall")
+def rodNearBallTerm(engine, state, params):
+    # Sum over the team's rods of 0.1 - (distance of the nearest figure to the ball in y) / 350
+    obs = state["obs"]
+    figures = engine.figureOffsets + engine.travels[:, None] * obs[:, 4:12, None]
+    distance = np.min(np.abs(figures - obs[:, 1, None, None]), axis=2)
+    closeness = 0.1 - distance / 350
+    return np.stack([closeness[:, engine.redRods].sum(axis=1), closeness[:, engine.blueRods].sum(axis=1)], axis=1)
+
+@term("ballDirection")
+def ballDirectionTerm(engine, state, params):
+    # Ball moving towards the opponent's goal
+    vx = state["obs"][:, 2]
+    return np.stack([vx > 0, vx < 0], axis=1).astype(np.float64)
+
+@term("contact")
+def contactTerm(engine, state, params):
+    return np.asarray(state["contacts"], dtype=np.float64)
+
+@term("stall")
+def stallTerm(engine, state, params):
+    stalled = (ballSpeed(state) < params.get("threshold", 0.05)).astype(np.float64)
+    return np.stack([stalled, stalled], axis=1)
+
+@term("goal")
+def goalTerm(engine, state, params):
+    goals = np.asarray(state["goals"], dtype=np.float64)
+    return goals - goals[:, ::-1]
+
+class RewardEngine:
+    def __init__(self, config='reward.json', geometryFile='geometry.json'):
+        cfg = json.loads(json.dumps(DEFAULT_CONFIG))
+        if isinstance(config, str):
+            if os.path.isfile(config):
+                with open(config) as f:
+                    cfg.update(json.load(f))
+        elif config is not None:
+            cfg.update(config)
+        self.config = cfg
+
+        for name in cfg["terms"]:
+            if name not in TERMS:
+                raise ValueError(f"Unknown reward term {name}")
+
+        # Terms with a weight, as (name, function, weight, params)
+        self.terms = [(name, TERMS[name], params.get("weight", 1.0), params) for name, params in cfg["terms"].items() if params.get("weight", 1.0) != 0]
+
+        with open(geometryFile) as f:
+            geometry = json.load(f)
+
+        # Figure y offsets at calibrated position 0, padded with a far away figure to 5 per rod
+        rods = geometry["rods"]
+        self.travels = np.array([r["travel"] for r in rods], dtype=np.float64)
+        self.figureOffsets = np.full((len(rods), 5), 1e6)
+        for i, r in enumerate(rods):
+            self.figureOffsets[i, :r["players"]] = r["first_offset"] + np.arange(r["players"]) * r["spacing"]
+        self.redRods = [i for i, r in enumerate(rods) if r["team"] == "red"]
+        self.blueRods = [i for i, r in enumerate(rods) if r["team"] == "blue"]
+
+        self.resetTotals()
+
+    def compute(self, state):
+        # Returns the rewards (N, 2) of red and blue and the weighted contribution of every term
+        contributions = {}
+        rewards = None
+
+        for name, f, weight, params in self.terms:
+            value = weight * f(self, state, params)
+            contributions[name] = value
+            rewards = value if rewards is None else rewards + value
+
+        if rewards is None:
+            rewards = np.zeros((len(state["obs"]), 2))
+
+        for name, value in contributions.items():
+            self.totals[name] += value.sum(axis=0)
+        self.count += len(rewards)
+
+        return rewards, contributions
+
+    def resetTotals(self):
+        self.totals = { name: np.zeros(2) for name, _, _, _ in self.terms }
+        self.count = 0
+
+    def summary(self, reset=True):
+        # Mean contribution of every term per state since the last reset, as { name: [red, blue] }
+        result = { name: (total / max(self.count, 1)).tolist() for name, total in self.totals.items() }
+        if reset:
+            self.resetTotals()
+        return result
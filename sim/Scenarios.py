@@ -0,0 +1,218 @@
+import argparse
+import json
+import math
+import time
+import numpy as np
+
+# Drills defined as data (scenarios.json), applied to the simulator by direct state resets.
+#
+# A scenario gives the distributions of the initial state and the conditions that end the episode:
+#   ball:         x, y (mm), vx, vy (m/s) in camera coordinates of the red player
+#   rodPositions, rodAngles: calibrated positions and angles, one value for all rods or a list of 8
+#   activeRods:   rods (0 is the red goalie) that follow the commands, the others hold their initial pose
+#   timeout:      episode length (s)
+#   success, failure: lists of alternatives, an alternative holds if all of its conditions hold
+# A value is a number or an interval [low, high] sampled uniformly.
+#
+# Conditions:
+#   goal:     "red" / "blue" scored since the start
+#   touch:    rods that touched the ball since the start (any of them)
+#   region:   ball inside { "x": [low, high], "y": [low, high] }
+#   velocity: ball velocity inside { "vx": [low, high], "vy": [low, high] }
+#   moved:    ball moved at least { "x": mm, "y": mm } from its initial position
+#   stopped:  ball speed below the given value (m/s)
+#
+# Running the drills headless, stepped as fast as possible:
+#   python Scenarios.py goalieSave fiveBarPass --episodes 1000 [--red-policy policy.npz]
+
+class ScenarioEngine:
+    def __init__(self, config='scenarios.json', names=None, seed=None):
+        if isinstance(config, str):
+            with open(config) as f:
+                config = json.load(f)
+
+        self.scenarios = { name: s for name, s in config["scenarios"].items() if names is None or name in names }
+        if len(self.scenarios) == 0:
+            raise ValueError(f"No scenarios {names}")
+
+        self.names = list(self.scenarios)
+        weights = np.array([self.scenarios[n].get("weight", 1.0) for n in self.names], dtype=np.float64)
+        self.weights = weights / weights.sum()
+
+        self.rng = np.random.default_rng(seed)
+
+        # Current episode
+        self.drill = None
+        self.startTime = 0
+        self.startScore = [0, 0]
+        self.startBall = (0, 0)
+        self.touched = set()
+
+        # Outcomes per scenario
+        self.results = { name: { "success": 0, "failure": 0, "timeout": 0 } for name in self.names }
+
+    def sampleValue(self, spec):
+        if isinstance(spec, (list, tuple)):
+            return float(self.rng.uniform(spec[0], spec[1]))
+        return float(spec)
+
+    def sampleRods(self, spec, default):
+        if spec is None:
+            return [default] * 8
+        if isinstance(spec, (list, tuple)) and len(spec) == 8:
+            return [self.sampleValue(s) for s in spec]
+        return [self.sampleValue(spec)] * 8
+
+    def sample(self, name=None):
+        # A drill with concrete initial values
+        if name is None:
+            name = self.names[self.rng.choice(len(self.names), p=self.weights)]
+        s = self.scenarios[name]
+
+        ball = s.get("ball", {})
+        return { "name": name,
+                 "ball": (self.sampleValue(ball.get("x", 605)), self.sampleValue(ball.get("y", 350))),
+                 "ballVelocity": (self.sampleValue(ball.get("vx", 0)), self.sampleValue(ball.get("vy", 0))),
+                 "rodPositions": self.sampleRods(s.get("rodPositions"), 0.5),
+                 "rodAngles": self.sampleRods(s.get("rodAngles"), 0),
+                 "activeRods": s.get("activeRods"),
+                 "timeout": s.get("timeout", 5.0),
+                 "success": s.get("success", []),
+                 "failure": s.get("failure", []) }
+
+    def apply(self, sim, drill, t):
+        # Puts the simulator into the initial state of the drill
+        sim.autoBall = False
+        sim.setState(ball=drill["ball"], ballVelocity=drill["ballVelocity"], rodPositions=drill["rodPositions"], rodAngles=drill["rodAngles"])
+        sim.actuators.setActive(drill["activeRods"])
+        sim.camera.reset(t)
+        sim.contacts = []
+        sim.takeTouchedRods()
+
+        self.drill = drill
+        self.startTime = t
+        self.startScore = list(sim.score)
+        self.startBall = drill["ball"]
+        self.touched = set()
+
+    def start(self, sim, t, name=None):
+        drill = self.sample(name)
+        self.apply(sim, drill, t)
+        return drill
+
+    def stop(self, sim):
+        # Back to free play
+        sim.autoBall = True
+        sim.actuators.setActive(None)
+        self.drill = None
+
+    def holds(self, sim, alternative, ball, velocity):
+        for kind, value in alternative.items():
+            if kind == "goal":
+                team = 0 if value == "red" else 1
+                ok = sim.score[team] > self.startScore[team]
+            elif kind == "touch":
+                ok = any(rod in self.touched for rod in value)
+            elif kind == "region":
+                ok = all(value[k][0] <= ball[i] <= value[k][1] for i, k in enumerate(("x", "y")) if k in value)
+            elif kind == "velocity":
+                ok = all(value[k][0] <= velocity[i] <= value[k][1] for i, k in enumerate(("vx", "vy")) if k in value)
+            elif kind == "moved":
+                ok = all(abs(ball[i] - self.startBall[i]) >= value[k] for i, k in enumerate(("x", "y")) if k in value)
+            elif kind == "stopped":
+                ok = math.hypot(velocity[0], velocity[1]) < value
+            else:
+                raise ValueError(f"Unknown drill condition {kind}")
+
+            if not ok:
+                return False
+        return True
+
+    def check(self, sim, t):
+        # Outcome of the current drill ("success", "failure", "timeout") or None while it runs.
+        # The touches are collected by the simulator on every update, so the ones between two checks count too.
+        if self.drill is None:
+            return None
+
+        self.touched |= sim.takeTouchedRods()
+
+        ball = (1000*sim.ballPos[0] - 115, 730 - 1000*sim.ballPos[1])
+        velocity = (sim.ballVel[0][0], -sim.ballVel[0][1])
+
+        outcome = None
+        if any(self.holds(sim, a, ball, velocity) for a in self.drill["failure"]):
+            outcome = "failure"
+        elif any(self.holds(sim, a, ball, velocity) for a in self.drill["success"]):
+            outcome = "success"
+        elif t - self.startTime >= self.drill["timeout"]:
+            outcome = "timeout"
+
+        if outcome is not None:
+            self.results[self.drill["name"]][outcome] += 1
+        return outcome
+
+    def summary(self):
+        summary = {}
+        for name, r in self.results.items():
+            episodes = sum(r.values())
+            summary[name] = dict(r, episodes=episodes, successRate=r["success"] / episodes if episodes > 0 else None)
+        return summary
+
+def runDrills(sim, engine, episodes, dt=0.002, agentPeriod=0.02):
+    # Runs the drills with the built-in agents, stepping the simulator directly (no realtime thread)
+    import pybullet as p
+
+    p.setRealTimeSimulation(0)
+    p.setTimeStep(dt)
+    sim.timeStep = dt
+
+    t = 0
+    prevAgent = -agentPeriod
+    done = 0
+    engine.start(sim, t)
+
+    while done < episodes:
+        sim.t = t
+        sim.updateState()
+
+        if engine.check(sim, t) is not None:
+            done += 1
+            engine.start(sim, t)
+            prevAgent = t - agentPeriod
+
+        if t - prevAgent >= agentPeriod:
+            for player, team, agent in ((1, "red", sim.p1), (2, "blue", sim.p2)):
+                camera = sim.getDelayedCamera(player, t - sim.simulatedDelay)
+                if camera is not None:
+                    sim.actuators.command(team, agent.process_data(camera, np.random.uniform(-1, 1, (4,3))), t)
+            prevAgent = t
+
+        sim.actuators.update(t)
+        sim.sampleCameras(t)
+        p.stepSimulation()
+        t += dt
+
+    engine.stop(sim)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='FuzbAI drills')
+    parser.add_argument('scenarios', nargs='*', help='Scenario names (all if none)')
+    parser.add_argument('--config', default='scenarios.json')
+    parser.add_argument('--episodes', type=int, default=100)
+    parser.add_argument('--red-policy', help='Exported policy of the red player (.npz, PolicyAgent.py)')
+    parser.add_argument('--blue-policy', help='Exported policy of the blue player (.npz, PolicyAgent.py)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    from FuzbAISim import FuzbAISim
+
+    sim = FuzbAISim(redPolicy=args.red_policy, bluePolicy=args.blue_policy)
+    engine = ScenarioEngine(args.config, args.scenarios or None, args.seed)
+
+    t0 = time.time()
+    runDrills(sim, engine, args.episodes)
+    elapsed = time.time() - t0
+
+    for name, s in engine.summary().items():
+        print(f"{name}: {s['episodes']} episodes, success {s['success']}, failure {s['failure']}, timeout {s['timeout']}")
+    print(f"{args.episodes} episodes in {elapsed:.1f} s ({60 * args.episodes / elapsed:.0f} per minute)")
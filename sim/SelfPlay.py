@@ -0,0 +1,224 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from PolicyAgent import PolicyAgent, exportModel
+
+# Self-play against a pool of frozen snapshots of the trained policy.
+#
+# The training process keeps the pool (OpponentPool): every snapshotInterval steps the current actor is
+# exported (PolicyAgent.py format) into the pool directory, and the win rates of the snapshots against
+# the learner are updated after every goal. SelfPlayCallback assigns an opponent to every vector-env
+# worker by the matchmaking rule and reassigns it after gamesPerOpponent goals.
+#
+# The workers (FoosballEnv.setOpponent) load the assigned snapshot in a background thread
+# (OpponentLoader) and swap it in as the built-in agent of the opponent team when it is ready. Until then
+# the previous opponent keeps playing, so the rollouts never wait for a new opponent.
+#
+# Matchmaking rules:
+#   latest:  always the newest snapshot
+#   uniform: any snapshot with the same probability
+#   pfsp:    snapshots that beat the learner more often are chosen more often (weight winRate^pfspExponent)
+#   mixed:   latest with latestProbability, pfsp otherwise
+
+DEFAULT_CONFIG = {
+    "poolSize": 20,
+    "snapshotInterval": 20000,
+    "matchmaking": "mixed",
+    "latestProbability": 0.5,
+    "pfspExponent": 2.0,
+    "gamesPerOpponent": 5,
+    "winRateAlpha": 0.05,
+    "initialWinRate": 0.5,
+    "swapSides": True
+}
+
+class OpponentPool:
+    def __init__(self, directory, config='selfplay.json', seed=None):
+        cfg = dict(DEFAULT_CONFIG)
+        if isinstance(config, str):
+            if os.path.isfile(config):
+                with open(config) as f:
+                    cfg.update(json.load(f))
+        elif config is not None:
+            cfg.update(config)
+        self.config = cfg
+
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.rng = np.random.default_rng(seed)
+
+        # Snapshots, oldest first, as { name, path, step, games, wins, losses, draws, winRate }
+        # (wins and winRate are those of the snapshot against the learner)
+        self.snapshots = []
+        self.index = {}
+
+        poolFile = os.path.join(self.directory, 'pool.json')
+        if os.path.isfile(poolFile):
+            with open(poolFile) as f:
+                self.snapshots = [s for s in json.load(f)["snapshots"] if os.path.isfile(s["path"])]
+            self.index = { s["name"]: s for s in self.snapshots }
+
+    def addSnapshot(self, model, step, normalize=None):
+        name = f"snapshot_{step}"
+        path = os.path.join(self.directory, name + ".npz")
+
+        # Workers may be loading from the directory, the file appears only when it is complete
+        tmp = os.path.join(self.directory, name + ".tmp.npz")
+        exportModel(model, tmp, normalize)
+        os.replace(tmp, path)
+
+        snapshot = { "name": name, "path": path, "step": step, "games": 0, "wins": 0, "losses": 0, "draws": 0,
+                     "winRate": self.config["initialWinRate"] }
+        self.snapshots.append(snapshot)
+        self.index[name] = snapshot
+
+        # Drop the oldest snapshots, their files are removed when no longer in the pool
+        while len(self.snapshots) > self.config["poolSize"]:
+            dropped = self.snapshots.pop(0)
+            del self.index[dropped["name"]]
+            try:
+                os.remove(dropped["path"])
+            except OSError:
+                pass
+
+        self.save()
+        return snapshot
+
+    def record(self, name, result):
+        # Result of one goal from the view of the snapshot: 1 won, 0 draw, -1 lost
+        snapshot = self.index.get(name)
+        if snapshot is None:
+            return
+
+        snapshot["games"] += 1
+        if result > 0:
+            snapshot["wins"] += 1
+        elif result < 0:
+            snapshot["losses"] += 1
+        else:
+            snapshot["draws"] += 1
+
+        # Exponential moving average, so that the rate follows the improving learner
+        snapshot["winRate"] += self.config["winRateAlpha"] * ((result + 1) / 2 - snapshot["winRate"])
+
+    def choose(self):
+        if len(self.snapshots) == 0:
+            return None
+
+        rule = self.config["matchmaking"]
+        if rule == "mixed":
+            rule = "latest" if self.rng.random() < self.config["latestProbability"] else "pfsp"
+
+        if rule == "latest":
+            return self.snapshots[-1]
+        if rule == "uniform":
+            return self.snapshots[self.rng.integers(len(self.snapshots))]
+        if rule == "pfsp":
+            weights = np.array([s["winRate"] for s in self.snapshots]) ** self.config["pfspExponent"] + 1e-3
+            return self.snapshots[self.rng.choice(len(self.snapshots), p=weights / weights.sum())]
+
+        raise ValueError(f"Unknown matchmaking rule {rule}")
+
+    def chooseTeam(self):
+        # Team of the opponent
+        if self.config["swapSides"] and self.rng.random() < 0.5:
+            return "red"
+        return "blue"
+
+    def summary(self):
+        return [{ k: s[k] for k in ("name", "games", "wins", "losses", "draws", "winRate") } for s in self.snapshots]
+
+    def save(self):
+        poolFile = os.path.join(self.directory, 'pool.json')
+        with open(poolFile + '.tmp', 'w') as f:
+            json.dump({ "snapshots": self.snapshots }, f, indent=2)
+        os.replace(poolFile + '.tmp', poolFile)
+
+class OpponentLoader:
+    # Worker side: loads the requested opponents in the background and swaps them into the simulator
+    def __init__(self, sim):
+        self.sim = sim
+        self.requests = queue.Queue()
+
+        # (snapshot name, team) of the opponent currently playing
+        self.current = None
+
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def request(self, name, path, team):
+        self.requests.put((name, path, team))
+
+    def load(self):
+        while True:
+            name, path, team = self.requests.get()
+
+            # Only the newest request matters
+            while not self.requests.empty():
+                name, path, team = self.requests.get_nowait()
+
+            try:
+                agent = PolicyAgent(path, team)
+            except (OSError, ValueError, KeyError) as e:
+                # Snapshot dropped from the pool meanwhile, keep the previous opponent
+                print(f"[SELFPLAY] Cannot load opponent {name}: {e}")
+                continue
+
+            if self.current is not None and self.current[1] != team:
+                # Sides swapped, the learner's team gets the default agent back
+                self.sim.setAgent(1 if self.current[1] == "red" else 2)
+
+            if team == "red":
+                self.sim.p1 = agent
+            else:
+                self.sim.p2 = agent
+
+            self.current = (name, team)
+
+class SelfPlayCallback(BaseCallback):
+    def __init__(self, pool, normalize=None, verbose=1):
+        super().__init__(verbose)
+        self.pool = pool
+        self.normalize = normalize
+        self.lastSnapshot = 0
+        self.gamesLeft = []
+
+    def _on_training_start(self):
+        if len(self.pool.snapshots) == 0:
+            self.pool.addSnapshot(self.model, self.num_timesteps, self.normalize)
+        self.lastSnapshot = self.num_timesteps
+
+        self.gamesLeft = [0] * self.training_env.num_envs
+        for i in range(self.training_env.num_envs):
+            self.assign(i)
+
+    def assign(self, i):
+        # Returns immediately, the worker loads the snapshot in the background
+        snapshot = self.pool.choose()
+        self.training_env.env_method("setOpponent", snapshot["name"], snapshot["path"], self.pool.chooseTeam(), indices=[i])
+        self.gamesLeft[i] = self.pool.config["gamesPerOpponent"]
+
+    def _on_step(self):
+        for i, info in enumerate(self.locals.get("infos", [])):
+            selfPlay = info.get("selfPlay")
+            if selfPlay is None:
+                continue
+
+            self.pool.record(selfPlay["opponent"], selfPlay["result"])
+            self.gamesLeft[i] -= 1
+            if self.gamesLeft[i] <= 0:
+                self.assign(i)
+
+        if self.num_timesteps - self.lastSnapshot >= self.pool.config["snapshotInterval"]:
+            self.lastSnapshot = self.num_timesteps
+            snapshot = self.pool.addSnapshot(self.model, self.num_timesteps, self.normalize)
+            if self.verbose > 0:
+                print(f"[SELFPLAY] Added {snapshot['name']}, pool: " +
+                      ", ".join(f"{s['name']} {s['winRate']:.2f} ({s['games']})" for s in self.pool.snapshots))
+
+        return True
+
+    def _on_training_end(self):
+        self.pool.save()
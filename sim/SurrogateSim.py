@@ -0,0 +1,297 @@
+import json
+import math
+import time
+import numpy as np
+
+# Planar NumPy surrogate of FuzbAISim for early policy search. Many tables are stepped at once as arrays.
+#
+# Everything is in the camera coordinates of the red player (mm, origin in the top-left corner,
+# see geometry.json). The ball is a disc bouncing off the walls, the goals are openings of goal_width
+# in the short walls. Every player figure is a capsule from its rod to the foot, the foot moves along
+# x with the rod rotation and only touches the ball while it is below the rod.
+#
+# The interface follows FuzbAISim: getCameraDict(player) returns the same camera dictionary and
+# setExternalCommands(player, commands) takes the same motor commands (per table, or for all of them).
+
+# Drive ID (1 to 4) -> rod index, per player
+DRIVE_MAP = [[0, 1, 3, 5], [7, 6, 4, 2]]
+
+class SurrogateSim:
+    def __init__(self, tables=1, geometryFile='geometry.json', seed=None):
+        with open(geometryFile) as f:
+            self.geometry = json.load(f)
+
+        self.n = tables
+        self.rng = np.random.default_rng(seed)
+
+        self.fieldX = self.geometry["field"]["dimension_x"]
+        self.fieldY = self.geometry["field"]["dimension_y"]
+        self.goalWidth = self.geometry["goal_width"]
+        self.ballRadius = self.geometry["ball_size"] / 2
+
+        rods = self.geometry["rods"]
+        self.rodX = np.array([r["position"] for r in rods], dtype=np.float64)
+        self.travels = np.array([r["travel"] for r in rods], dtype=np.float64)
+
+        # Figures of all rods as flat arrays (rod index, offset of the figure on its rod)
+        self.figRod = np.array([i for i, r in enumerate(rods) for _ in range(r["players"])])
+        self.figOffset = np.array([r["first_offset"] + k * r["spacing"] for r in rods for k in range(r["players"])], dtype=np.float64)
+
+        # Figure and dynamics constants, roughly matched to the 3D simulator (see fidelityReport)
+        self.legLength = 80         # mm, rod axis to the foot
+        self.figureRadius = 12      # mm, half width of the figure
+        self.maxFootAngle = 1.2     # rad, the foot is above the ball beyond this angle
+        self.restitution = 0.45     # walls
+        self.figureRestitution = 0.6
+        self.damping = 0.4          # 1/s, rolling resistance
+        self.stationaryTime = 3     # s, ball is dropped at a random location if it stops for longer
+
+        # Motor limits (as in actuator.json)
+        self.linVel = 1.5910861528058136 * 1000 # mm/s
+        self.rotVel = 174.74649915501303        # rad/s
+
+        self.ballPosNoise = 5
+        self.ballVelNoise = 0.01
+
+        self.t = 0
+        self.reset()
+
+    def reset(self, tables=None):
+        if tables is None:
+            tables = np.arange(self.n)
+            self.ballPos = np.zeros((self.n, 2))
+            self.ballVel = np.zeros((self.n, 2))
+            self.rodPositions = np.full((self.n, 8), 0.5)   # Calibrated rod positions [0, 1]
+            self.rodRotations = np.zeros((self.n, 8))       # rad
+            self.rodPositionTarget = np.full((self.n, 8), 0.5)
+            self.rodRotationTarget = np.zeros((self.n, 8))
+            self.rodPositionRate = np.full((self.n, 8), self.linVel) / self.travels
+            self.rodRotationRate = np.full((self.n, 8), self.rotVel)
+            self.score = np.zeros((self.n, 2), dtype=np.int64)
+            self.lastMoving = np.zeros(self.n)
+
+        self.rodPositions[tables] = 0.5
+        self.rodRotations[tables] = 0
+        self.rodPositionTarget[tables] = 0.5
+        self.rodRotationTarget[tables] = 0
+        self.score[tables] = 0
+        self.dropBall(tables, center=True)
+
+    def dropBall(self, tables, center=False):
+        # Drop the ball at the start location (or a random one) with a small random velocity
+        count = len(tables)
+        if center:
+            self.ballPos[tables] = [self.fieldX / 2, self.fieldY / 2]
+        else:
+            self.ballPos[tables, 0] = self.rng.uniform(0.1, 0.9, count) * self.fieldX
+            self.ballPos[tables, 1] = self.rng.uniform(0.1, 0.9, count) * self.fieldY
+
+        self.ballVel[tables] = self.rng.uniform(-100, 100, (count, 2))
+        self.lastMoving[tables] = self.t
+
+    def setExternalCommands(self, player, commands, table=None):
+        # Same motor commands as FuzbAISim, for one table or all of them
+        tables = slice(None) if table is None else table
+        driveMap = DRIVE_MAP[player - 1]
+
+        for m in commands:
+            rod = driveMap[m["driveID"]-1]
+            self.rodPositionTarget[tables, rod] = 1 - m["translationTargetPosition"]
+            self.rodPositionRate[tables, rod] = self.linVel * m["translationVelocity"] / self.travels[rod]
+
+            self.rodRotationTarget[tables, rod] = m["rotationTargetPosition"] * 2 * math.pi
+            self.rodRotationRate[tables, rod] = self.rotVel * m["rotationVelocity"]
+
+    def setCommandArrays(self, player, rotation, rotationVelocity, translation, translationVelocity):
+        # Batched version of setExternalCommands, every argument has shape (tables, 4) in drive order
+        rods = DRIVE_MAP[player - 1]
+
+        self.rodPositionTarget[:, rods] = 1 - np.asarray(translation)
+        self.rodPositionRate[:, rods] = self.linVel * np.asarray(translationVelocity) / self.travels[rods]
+
+        self.rodRotationTarget[:, rods] = 2 * math.pi * np.asarray(rotation)
+        self.rodRotationRate[:, rods] = self.rotVel * np.asarray(rotationVelocity)
+
+    def step(self, dt=0.002):
+        prevPositions = self.rodPositions.copy()
+        prevRotations = self.rodRotations.copy()
+
+        # Rods move towards their targets with the commanded velocity
+        self.rodPositions += np.clip(self.rodPositionTarget - self.rodPositions, -self.rodPositionRate * dt, self.rodPositionRate * dt)
+        self.rodRotations += np.clip(self.rodRotationTarget - self.rodRotations, -self.rodRotationRate * dt, self.rodRotationRate * dt)
+
+        # Ball motion with rolling resistance
+        self.ballVel *= math.exp(-self.damping * dt)
+        self.ballPos += self.ballVel * dt
+
+        self.collideFigures(prevPositions, prevRotations, dt)
+        self.collideWalls()
+
+        self.t += dt
+
+        moving = np.hypot(self.ballVel[:, 0], self.ballVel[:, 1]) > 50
+        self.lastMoving[moving] = self.t
+        stationary = np.nonzero(self.t - self.lastMoving > self.stationaryTime)[0]
+        if len(stationary) > 0:
+            self.dropBall(stationary)
+
+    def collideFigures(self, prevPositions, prevRotations, dt):
+        rods = self.figRod
+        r = self.ballRadius + self.figureRadius
+
+        q = self.rodRotations[:, rods]
+        rodY = self.figOffset + self.travels[rods] * self.rodPositions[:, rods]
+        reach = self.legLength * np.sin(q)
+
+        # Closest point on the capsule (rod axis to foot, along x) to the ball centre
+        bx = self.ballPos[:, 0:1]
+        by = self.ballPos[:, 1:2]
+        u = np.clip((bx - self.rodX[rods]) / np.where(np.abs(reach) > 1e-6, reach, 1e-6), 0, 1)
+        cx = self.rodX[rods] + u * reach
+        dx = bx - cx
+        dy = by - rodY
+        dist = np.hypot(dx, dy)
+
+        penetration = np.where((np.abs(q) < self.maxFootAngle) & (dist < r), r - dist, 0)
+
+        # Resolve the deepest contact of every table
+        fi = np.argmax(penetration, axis=1)
+        tables = np.nonzero(penetration[np.arange(self.n), fi] > 0)[0]
+        if len(tables) == 0:
+            return
+
+        fi = fi[tables]
+        d = np.maximum(dist[tables, fi], 1e-6)
+        normal = np.stack([dx[tables, fi], dy[tables, fi]], axis=-1) / d[:, None]
+        self.ballPos[tables] += normal * penetration[tables, fi][:, None]
+
+        # Velocity of the contact point on the figure
+        rod = rods[fi]
+        qdot = (self.rodRotations[tables, rod] - prevRotations[tables, rod]) / dt
+        ydot = self.travels[rod] * (self.rodPositions[tables, rod] - prevPositions[tables, rod]) / dt
+        pointVel = np.stack([u[tables, fi] * self.legLength * np.cos(q[tables, fi]) * qdot, ydot], axis=-1)
+
+        relVel = self.ballVel[tables] - pointVel
+        vn = np.sum(relVel * normal, axis=1)
+        approaching = vn < 0
+        self.ballVel[tables] -= ((1 + self.figureRestitution) * np.where(approaching, vn, 0))[:, None] * normal
+
+    def collideWalls(self):
+        x, y = self.ballPos[:, 0], self.ballPos[:, 1]
+        r = self.ballRadius
+
+        # Goals - red defends x = 0, blue defends x = fieldX
+        inGoal = np.abs(y - self.fieldY / 2) < self.goalWidth / 2 - r
+        blueScored = np.nonzero(inGoal & (x < -r))[0]
+        redScored = np.nonzero(inGoal & (x > self.fieldX + r))[0]
+        self.score[blueScored, 1] += 1
+        self.score[redScored, 0] += 1
+        if len(blueScored) + len(redScored) > 0:
+            self.dropBall(np.concatenate([blueScored, redScored]), center=True)
+
+        # Walls (the ball can enter the goal openings)
+        for axis, limit, opening in ((0, self.fieldX, inGoal), (1, self.fieldY, None)):
+            low = self.ballPos[:, axis] < r
+            high = self.ballPos[:, axis] > limit - r
+            if opening is not None:
+                low &= ~opening
+                high &= ~opening
+
+            self.ballPos[low, axis] = 2*r - self.ballPos[low, axis]
+            self.ballPos[high, axis] = 2*(limit - r) - self.ballPos[high, axis]
+            self.ballVel[low | high, axis] *= -self.restitution
+
+    def observe(self, player=1):
+        # Observation array (tables, 20) as in FoosballEnv: ball x, y, vx, vy, rod positions, rod angles
+        ball = self.ballPos.copy()
+        vel = self.ballVel / 1000
+        rp = self.rodPositions
+        ra = 32 * self.rodRotations / math.pi
+
+        if player == 2:
+            ball = np.array([self.fieldX, self.fieldY]) - ball
+            vel = -vel
+            rp = 1 - rp[:, ::-1]
+            ra = -ra[:, ::-1]
+
+        return np.concatenate([ball, vel, rp, ra], axis=1).astype(np.float32)
+
+    def getCameraDict(self, player=1, table=0):
+        obs = self.observe(player)[table]
+        ballSize = 35 * 1e3 / np.hypot(obs[0] - np.array([100, 1100]), obs[1] - 350)
+
+        camData = []
+        for ci in range(2):
+            camData.append({ "cameraID": ci,
+                "ball_x": float(obs[0] + (self.rng.random() - 0.5) * self.ballPosNoise), "ball_y": float(obs[1] + (self.rng.random() - 0.5) * self.ballPosNoise),
+                "ball_vx": float(obs[2] + (self.rng.random() - 0.5) * self.ballVelNoise), "ball_vy": float(obs[3] + (self.rng.random() - 0.5) * self.ballVelNoise),
+                "ball_size": float(ballSize[ci]),
+                "rod_position_calib": obs[4:12].tolist(), "rod_angle": obs[12:20].tolist() })
+
+        score = self.score[table].tolist()
+        return { "camData": camData, "camDataOK": [True, True], "score": score if player == 1 else score[::-1] }
+
+def fidelityReport(runs=20, duration=1.0, dt=0.002, seed=0):
+    # Rolls out the same ball launches in FuzbAISim (headless, stepped) and in the surrogate and compares the trajectories
+    import pybullet as p
+    from FuzbAISim import FuzbAISim
+
+    sim = FuzbAISim()
+    p.setRealTimeSimulation(0)
+    p.setTimeStep(dt)
+
+    surrogate = SurrogateSim(tables=runs, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    start = np.stack([rng.uniform(250, 950, runs), rng.uniform(150, 550, runs)], axis=1)
+    velocity = np.stack([rng.uniform(-1500, 1500, runs), rng.uniform(-800, 800, runs)], axis=1)
+
+    steps = int(duration / dt)
+    errors = np.zeros((runs, steps))
+
+    # 3D sim, one launch after the other
+    t0 = time.time()
+    reference = np.zeros((runs, steps, 2))
+    for i in range(runs):
+        p.resetBasePositionAndOrientation(sim.ball, [(start[i, 0] + 115) / 1000, (730 - start[i, 1]) / 1000, 0.1915], [0, 0, 0, 1])
+        # Launch the ball already rolling (the surrogate has no sliding phase)
+        vx, vy, r = velocity[i, 0] / 1000, -velocity[i, 1] / 1000, 0.0175
+        p.resetBaseVelocity(sim.ball, [vx, vy, 0], [-vy / r, vx / r, 0])
+
+        for k in range(steps):
+            p.stepSimulation()
+            pos, _ = p.getBasePositionAndOrientation(sim.ball)
+            reference[i, k] = [1000*pos[0] - 115, 730 - 1000*pos[1]]
+    fullTime = time.time() - t0
+
+    # Surrogate, all launches at once, with the rods where they are in the 3D sim
+    t0 = time.time()
+    surrogate.rodPositions[:] = [1 - 1000 * js[0] / sim.travels[i] for i, js in enumerate(p.getJointStates(sim.mizaId, sim.slideJoints))]
+    surrogate.rodRotations[:] = [js[0] for js in p.getJointStates(sim.mizaId, sim.revJoints)]
+    surrogate.rodPositionTarget[:] = surrogate.rodPositions
+    surrogate.rodRotationTarget[:] = surrogate.rodRotations
+    surrogate.ballPos[:] = start
+    surrogate.ballVel[:] = velocity
+    for k in range(steps):
+        surrogate.step(dt)
+        errors[:, k] = np.hypot(*(surrogate.ballPos - reference[:, k]).T)
+    surrogateTime = time.time() - t0
+
+    p.disconnect()
+
+    # Throughput of a large batch
+    batch = SurrogateSim(tables=4096, seed=seed)
+    t0 = time.time()
+    for k in range(100):
+        batch.step(dt)
+    batchRate = 4096 * 100 / (time.time() - t0)
+
+    print(f"Fidelity report ({runs} launches, {duration} s each)")
+    print(f"  Position error (mm): median at 0.2 s {np.median(errors[:, int(0.2/dt)]):.1f}, median at the end {np.median(errors[:, -1]):.1f}, mean {errors.mean():.1f}, max {errors.max():.1f}")
+    print(f"  Time: 3D simulator {fullTime:.2f} s, surrogate {surrogateTime:.3f} s ({fullTime / max(surrogateTime, 1e-9):.0f}x)")
+    print(f"  Steps per second: 3D simulator {runs * steps / fullTime:.0f}, surrogate with 4096 tables {batchRate:.0f} ({batchRate * fullTime / (runs * steps):.0f}x)")
+
+    return errors
+
+if __name__ == "__main__":
+    fidelityReport()
@@ -0,0 +1,294 @@
+import argparse
+import datetime
+import glob
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import struct
+import time
+import numpy as np
+
+# System identification of the simulator physics (motors, ball and table) from logged trajectories.
+#
+# The input is a replay log recorded by FuzbAISimServer (--replay-dir, <table>/*.dat): camera frames
+# (rod and ball states out) and motor commands (in). The log is split into short windows. Every window
+# starts from the logged state and is replayed with the logged commands in headless simulators, one per
+# worker process. A derivative-free evolution strategy fits the parameters to minimize the difference
+# between the simulated and the logged states.
+#
+# The logged commands are converted to the motor conventions of the simulator in sim/ (ActuatorModel), which
+# drives both teams the same way. The wrapper simulator and the real table turn the blue rods by
+# -rotationTargetPosition and move the red rods to 1 - translationTargetPosition of their travel.
+#
+# The result is written to physics.json with an increased version (the previous file is kept as
+# physics_v<version>.json). It is loaded on start by the training simulator in sim/ (sim/FuzbAISim.py) only,
+# the wrapper simulator (wrapper/src) does not read it.
+#
+#   python SysId.py ../server/logs/0 --generations 30 --workers 8
+
+# Record format of ReplayStore (server/ReplayStore.py)
+RECORD = struct.Struct('<dBI')
+KIND_CAMERA = 1
+KIND_COMMANDS_RED = 2
+KIND_COMMANDS_BLUE = 3
+
+# Fitted parameters as (name, lower bound, upper bound), the names are paths in physics.json
+PARAMETERS = [
+    ("ball.restitution", 0.05, 0.99),
+    ("ball.lateralFriction", 0.01, 1.0),
+    ("ball.rollingFriction", 1e-7, 1e-2),
+    ("ball.spinningFriction", 1e-4, 0.1),
+    ("table.restitution", 0.05, 0.99),
+    ("actuator.rotation.force", 0.2, 20),
+    ("actuator.rotation.positionGain", 0.05, 20),
+    ("actuator.rotation.velocityGain", 0.05, 50),
+    ("actuator.rotation.maxVelocity", 5, 500),
+    ("actuator.translation.force", 1, 100),
+    ("actuator.translation.positionGain", 0.01, 5),
+    ("actuator.translation.velocityGain", 0.05, 50),
+    ("actuator.translation.maxVelocity", 0.1, 10),
+]
+
+def readLog(path):
+    # Returns all records of the replay log as (time, kind, payload), ordered by time
+    records = []
+    for fileName in sorted(glob.glob(os.path.join(path, '*.dat')), key=lambda n: int(os.path.basename(n)[:-4])):
+        with open(fileName, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            t, kind, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            records.append((t, kind, data[offset : offset + length]))
+            offset += length
+
+    records.sort(key=lambda r: r[0])
+    return records
+
+def cameraState(payload):
+    # (ball x, ball y, ball vx, ball vy, rod positions, rod angles) of a logged camera frame, None without a valid ball
+    camStat = json.loads(payload)
+    cd = camStat["camData"][0]
+    if not camStat.get("camDataOK", [True])[0]:
+        return None
+
+    return (cd["ball_x"], cd["ball_y"], cd["ball_vx"], cd["ball_vy"], cd["rod_position_calib"], cd["rod_angle"])
+
+def toSimCommands(kind, commands):
+    # Logged (wrapper / table) motor commands in the conventions of sim/ActuatorModel
+    if kind == KIND_COMMANDS_BLUE:
+        return [dict(m, rotationTargetPosition=-m["rotationTargetPosition"]) for m in commands]
+    return [dict(m, translationTargetPosition=1 - m["translationTargetPosition"]) for m in commands]
+
+def splitWindows(records, window, cameraDelay):
+    # Windows of the log as { "start": camera state, "events": [(relative time, kind, data)] }
+    windows = []
+    current = None
+
+    for t, kind, payload in records:
+        try:
+            if kind == KIND_CAMERA:
+                # Frames arrive cameraDelay after the state they show
+                t -= cameraDelay
+                data = cameraState(payload)
+                if data is None:
+                    continue
+            else:
+                data = toSimCommands(kind, json.loads(payload)["commands"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            continue
+
+        if current is None or t - current["t0"] > window:
+            if kind != KIND_CAMERA:
+                continue
+
+            current = { "t0": t, "start": data, "events": [] }
+            windows.append(current)
+            continue
+
+        current["events"].append((t - current["t0"], kind, data))
+
+    return [w for w in windows if sum(1 for e in w["events"] if e[1] == KIND_CAMERA) > 10]
+
+def toPhysics(values, base):
+    physics = json.loads(json.dumps(base))
+    for (name, _, _), value in zip(PARAMETERS, values):
+        section = physics
+        keys = name.split('.')
+        for k in keys[:-1]:
+            section = section.setdefault(k, {})
+        section[keys[-1]] = float(value)
+    return physics
+
+def fromPhysics(physics, actuatorConfig):
+    values = []
+    for name, _, _ in PARAMETERS:
+        keys = name.split('.')
+        section = physics
+        for k in keys[:-1]:
+            section = section.get(k, {})
+
+        if keys[-1] in section:
+            values.append(section[keys[-1]])
+        else:
+            # Actuator parameters default to actuator.json
+            values.append(actuatorConfig[keys[1]][keys[2]])
+    return np.array(values, dtype=np.float64)
+
+# Worker process state
+sim = None
+windows = None
+basePhysics = None
+weights = None
+
+def initWorker(simDir, workerWindows, physics, lossWeights, dt):
+    global sim, windows, basePhysics, weights, p
+
+    os.chdir(simDir)
+    import pybullet as p
+    from FuzbAISim import FuzbAISim
+
+    sim = FuzbAISim()
+    p.setRealTimeSimulation(0)
+    p.setTimeStep(dt)
+    sim.timeStep = dt
+
+    windows = workerWindows
+    basePhysics = physics
+    weights = lossWeights
+
+def evaluate(task):
+    # Loss of one parameter vector on one window
+    values, wi = task
+    w = windows[wi]
+
+    sim.setPhysics(toPhysics(values, basePhysics))
+
+    bx, by, vx, vy, rods, angles = w["start"]
+    sim.setState(ball=(bx, by), ballVelocity=(vx, vy), rodPositions=rods, rodAngles=angles)
+
+    dt = sim.timeStep
+    t = 0
+    errors = np.zeros(3)
+    count = 0
+
+    for te, kind, data in w["events"]:
+        while t + dt <= te:
+            sim.actuators.update(t)
+            p.stepSimulation()
+            t += dt
+
+        if kind == KIND_COMMANDS_RED:
+            sim.actuators.command("red", data, t)
+        elif kind == KIND_COMMANDS_BLUE:
+            sim.actuators.command("blue", data, t)
+        else:
+            sim.readRods()
+            ballPos, _ = p.getBasePositionAndOrientation(sim.ball)
+            ball = np.array([1000*ballPos[0] - 115, 730 - 1000*ballPos[1]])
+
+            ex, ey, _, _, rods, angles = data
+            errors += [np.mean((np.array(sim.rodPositions) - rods) ** 2),
+                       np.mean(((np.array(sim.rodAngles) - angles) / 32) ** 2),
+                       np.sum(((ball - [ex, ey]) / 100) ** 2)]
+            count += 1
+
+    return float(np.dot(weights, errors) / max(count, 1))
+
+def fit(pool, x0, windowCount, generations, population, sigma, seed):
+    # (mu/mu_w, lambda) evolution strategy in the log space of the parameters
+    rng = np.random.default_rng(seed)
+
+    low = np.log([pm[1] for pm in PARAMETERS])
+    high = np.log([pm[2] for pm in PARAMETERS])
+
+    def losses(candidates):
+        tasks = [(np.exp(c), wi) for c in candidates for wi in range(windowCount)]
+        return np.array(pool.map(evaluate, tasks)).reshape(len(candidates), windowCount).mean(axis=1)
+
+    mean = np.clip(np.log(x0), low, high)
+    mu = population // 2
+    w = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    w /= w.sum()
+
+    best = mean.copy()
+    bestLoss = initialLoss = losses([mean])[0]
+    print(f"Initial loss {initialLoss:.5f}")
+
+    for gen in range(generations):
+        t0 = time.time()
+        candidates = np.clip(mean + sigma * rng.standard_normal((population, len(mean))), low, high)
+        loss = losses(candidates)
+
+        order = np.argsort(loss)
+        mean = np.sum(w[:, None] * candidates[order[:mu]], axis=0)
+
+        # Grow the step while improving, shrink it otherwise
+        if loss[order[0]] < bestLoss:
+            best, bestLoss = candidates[order[0]].copy(), loss[order[0]]
+            sigma *= 1.2
+        else:
+            sigma *= 0.8
+
+        print(f"Generation {gen + 1}/{generations}: best {bestLoss:.5f}, generation best {loss[order[0]]:.5f}, sigma {sigma:.3f} ({time.time() - t0:.1f} s)")
+
+    return np.exp(best), bestLoss, initialLoss
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='FuzbAI system identification')
+    parser.add_argument('log', help='Replay log directory of one table (FuzbAISimServer --replay-dir)')
+    parser.add_argument('--output', default='physics.json', help='Physics parameter file')
+    parser.add_argument('--window', type=float, default=2.0, help='Length of the replayed windows (s)')
+    parser.add_argument('--max-windows', type=int, default=32, help='Maximal number of windows used for fitting')
+    parser.add_argument('--camera-delay', type=float, default=0.040, help='Delay of the logged camera frames (s)')
+    parser.add_argument('--generations', type=int, default=30)
+    parser.add_argument('--population', type=int, default=16)
+    parser.add_argument('--sigma', type=float, default=0.2, help='Initial step in log space (0.2 = about 20 %%)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--weights', type=float, nargs=3, default=[1.0, 1.0, 1.0], help='Loss weights of rod positions, rod angles and the ball')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from FuzbAISim import loadPhysics
+    from ActuatorModel import DEFAULT_CONFIG
+
+    physics = loadPhysics(args.output)
+    actuatorConfig = json.loads(json.dumps(DEFAULT_CONFIG))
+    if os.path.isfile('actuator.json'):
+        with open('actuator.json') as f:
+            for k, v in json.load(f).items():
+                if k in ("rotation", "translation"):
+                    actuatorConfig[k].update(v)
+
+    records = readLog(args.log)
+    logWindows = splitWindows(records, args.window, args.camera_delay)
+    if len(logWindows) == 0:
+        raise SystemExit(f"No usable camera frames in {args.log}")
+
+    # Spread the windows over the whole log
+    if len(logWindows) > args.max_windows:
+        logWindows = [logWindows[int(i)] for i in np.linspace(0, len(logWindows) - 1, args.max_windows)]
+
+    print(f"{len(records)} records, fitting on {len(logWindows)} windows of {args.window} s with {args.workers} workers")
+
+    with multiprocessing.Pool(args.workers, initializer=initWorker, initargs=(os.getcwd(), logWindows, physics, args.weights, 0.002)) as pool:
+        values, loss, initialLoss = fit(pool, fromPhysics(physics, actuatorConfig), len(logWindows),
+                                        args.generations, args.population, args.sigma, args.seed)
+
+    result = toPhysics(values, physics)
+    result["version"] = physics["version"] + 1
+    result["fitted"] = datetime.datetime.now().isoformat(timespec='seconds')
+    result["log"] = os.path.abspath(args.log)
+    result["loss"] = loss
+    result["initialLoss"] = initialLoss
+
+    if os.path.isfile(args.output):
+        shutil.copyfile(args.output, f"{os.path.splitext(args.output)[0]}_v{physics['version']}.json")
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"Loss {initialLoss:.5f} -> {loss:.5f}, parameters version {result['version']} written to {args.output}")
@@ -1,19 +1,18 @@
+import argparse
 import torch
 import numpy as np
 from stable_baselines3 import SAC
-from stable_baselines3.common.vec_env import DummyVecEnv
-from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+from stable_baselines3.common.callbacks import BaseCallback, CallbackList
 from GymEnv import FoosballEnv
 
-# Check if GPU is available
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"[DEBUG] Using device: {device}")
-
-# Wrap environment
-env = DummyVecEnv([lambda: FoosballEnv(debug=True)])
-
-print(f"[DEBUG] Action space shape: {env.action_space.shape}")
-print(f"[DEBUG] Observation space shape: {env.observation_space.shape}")
+def makeEnv(i, debug, scenarioNames):
+    # Every worker samples its own drills
+    scenarios = None
+    if scenarioNames is not None:
+        from Scenarios import ScenarioEngine
+        scenarios = ScenarioEngine('scenarios.json', scenarioNames or None, seed=i)
+    return lambda: FoosballEnv(debug=debug, scenarios=scenarios)
 
 # Custom callback to monitor training
 class TrainingMonitor(BaseCallback):
@@ -21,35 +20,76 @@ class TrainingMonitor(BaseCallback):
         super(TrainingMonitor, self).__init__(verbose)
         self.check_freq = check_freq
         self.episode_rewards = []
+        self.term_totals = {}
+        self.term_count = 0
 
     def _on_step(self) -> bool:
         if "rewards" in self.locals:
             self.episode_rewards.append(self.locals["rewards"])
 
+        # Contributions of the reward terms (red, blue)
+        for info in self.locals.get("infos", []):
+            for name, value in info.get("rewardTerms", {}).items():
+                self.term_totals[name] = self.term_totals.get(name, 0) + np.array(value)
+            self.term_count += 1
+
         if self.n_calls % self.check_freq == 0:
             mean_reward = np.mean(self.episode_rewards[-10:])
             print(f"[TRAINING] Step {self.n_calls} | Avg Reward (Last 10): {mean_reward:.2f}")
 
+            if self.term_count > 0:
+                print("[TRAINING] Reward terms (red/blue): " + ", ".join(f"{name} {v[0] / self.term_count:.3f}/{v[1] / self.term_count:.3f}" for name, v in self.term_totals.items()))
+            self.term_totals = {}
+            self.term_count = 0
+
         return True
 
-# ✅ Use **one** SAC model that learns for **both** players (instead of separate models)
-model = SAC("MlpPolicy", env, verbose=1, device=device)
+def main():
+    parser = argparse.ArgumentParser(prog='FuzbAI training')
+    parser.add_argument('--envs', type=int, default=1, help='Number of simulators (worker processes if more than 1)')
+    parser.add_argument('--self-play', metavar='POOL_DIR', help='Play against a pool of past snapshots (SelfPlay.py) kept in POOL_DIR')
+    parser.add_argument('--scenarios', nargs='*', metavar='NAME', help='Train on drills from scenarios.json (all if no names given)')
+    args = parser.parse_args()
+
+    # Check if GPU is available
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"[DEBUG] Using device: {device}")
+
+    # Wrap environment
+    if args.envs > 1:
+        env = SubprocVecEnv([makeEnv(i, False, args.scenarios) for i in range(args.envs)])
+    else:
+        env = DummyVecEnv([makeEnv(0, True, args.scenarios)])
+
+    print(f"[DEBUG] Action space shape: {env.action_space.shape}")
+    print(f"[DEBUG] Observation space shape: {env.observation_space.shape}")
+
+    # ✅ Use **one** SAC model that learns for **both** players (instead of separate models)
+    model = SAC("MlpPolicy", env, verbose=1, device=device)
+
+    # Attach callback for monitoring
+    callback = TrainingMonitor(check_freq=100)
+
+    if args.self_play:
+        from SelfPlay import OpponentPool, SelfPlayCallback
+        callback = CallbackList([callback, SelfPlayCallback(OpponentPool(args.self_play))])
 
-# Attach callback for monitoring
-callback = TrainingMonitor(check_freq=100)
+    # Train model
+    print("[TRAINING] Starting training...")
+    model.learn(total_timesteps=200000, callback=callback)
 
-# Train model
-print("[TRAINING] Starting training...")
-model.learn(total_timesteps=200000, callback=callback)
+    # Save trained model
+    model.save("foosball_agent")
 
-# Save trained model
-model.save("foosball_agent")
+    # ✅ Test the trained model for 100 steps
+    obs = env.reset()
+    for _ in range(100):
+        action, _ = model.predict(obs)  # Get actions for both players
 
-# ✅ Test the trained model for 100 steps
-obs = env.reset()
-for _ in range(100):
-    action, _ = model.predict(obs)  # Get actions for both players
+        print(f"[DEBUG] RL Model Generated Actions: {action} (Shape: {action.shape})")
 
-    print(f"[DEBUG] RL Model Generated Actions: {action} (Shape: {action.shape})")
+        obs, rewards, dones, info = env.step(action)  # Pass combined actions into environment
 
-    obs, rewards, dones, info = env.step(action)  # Pass combined actions into environment
\ No newline at end of file
+# The worker processes of SubprocVecEnv (spawn/forkserver) import this file again
+if __name__ == "__main__":
+    main()
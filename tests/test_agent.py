@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "server"))
+sys.path.insert(0, os.path.join(root, "wrapper", "src"))
+
+from fastapi.testclient import TestClient
+import FuzbAISimServer
+import FuzbAISim
+import FuzbAIAgent
+
+def test_empty_policy_restores_default_agent(monkeypatch):
+    # The server runs from its own directory, not the simulator's
+    monkeypatch.chdir(os.path.join(root, "server"))
+    monkeypatch.setattr(FuzbAISimServer, "replayDir", tempfile.mkdtemp())
+    monkeypatch.setattr(FuzbAISimServer, "simDir", os.path.join(root, "wrapper", "src"))
+
+    with TestClient(FuzbAISimServer.app) as client:
+        table = FuzbAISimServer.tables["0"]
+        # The constructor opens the pybullet GUI, setAgent needs none of it
+        table.sim = FuzbAISim.FuzbAISim.__new__(FuzbAISim.FuzbAISim)
+        table.sim.p2 = None
+
+        response = client.put("/Agent", params={ "blue": True, "policy": "" })
+        assert response.status_code == 200
+        assert response.json() == { "blue": True, "policy": "default" }
+        assert isinstance(table.sim.p2, FuzbAIAgent.PlayerAgent)
+
+        table.sim = None
@@ -0,0 +1,19 @@
+import os
+import filecmp
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules copied between the directories that run on their own (see the note at the top of each file)
+SHARED = [
+    ("sim/MatchStats.py", "server/MatchStats.py"),
+    ("sim/PolicyAgent.py", "wrapper/src/PolicyAgent.py"),
+    ("sim/CameraPipeline.py", "wrapper/src/CameraPipeline.py"),
+    ("sim/ActuatorModel.py", "wrapper/src/ActuatorModel.py"),
+    ("server/FuzbAIWire.py", "wrapper/src/FuzbAIWire.py"),
+    ("server/FuzbAIShm.py", "wrapper/src/FuzbAIShm.py"),
+]
+
+@pytest.mark.parametrize("a, b", SHARED)
+def test_shared_copies_identical(a, b):
+    assert filecmp.cmp(os.path.join(root, a), os.path.join(root, b), shallow=False), f"{a} and {b} differ"
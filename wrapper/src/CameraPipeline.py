@@ -0,0 +1,160 @@
+import json
+import math
+import random
+import os
+
+# Camera stage of the simulator. The real table has two cameras running at a fixed frame rate,
+# each with its own phase, a jittered processing latency and occasional lost frames. The ball is
+# partially hidden whenever it is under a player figure, which shows as a smaller ball_size and
+# eventually as a lost detection.
+#
+# Frames are produced only at camera ticks. Every frame carries the latest data of both cameras
+# (the camera that ticked is updated) and becomes visible to the agents after its latency.
+#
+# Keep this file identical in sim/ and wrapper/src/.
+
+DEFAULT_CONFIG = {
+    "cameras": [
+        { "fps": 100, "phase": 0.000, "latencyMean": 0.040, "latencyStd": 0.004, "latencyMin": 0.030, "dropout": 0.005 },
+        { "fps": 100, "phase": 0.005, "latencyMean": 0.040, "latencyStd": 0.004, "latencyMin": 0.030, "dropout": 0.005 }
+    ],
+
+    # Size of a player figure as seen from above (in mm) and the smallest visible ball area that is still detected
+    "figureWidth": 30,
+    "figureDepth": 24,
+    "minBallSize": 10
+}
+
+class CameraPipeline:
+    def __init__(self, sim, config=None, geometryFile='geometry.json', seed=None):
+        self.sim = sim
+
+        self.config = dict(DEFAULT_CONFIG)
+        if isinstance(config, str):
+            if os.path.isfile(config):
+                with open(config) as f:
+                    self.config.update(json.load(f))
+        elif config is not None:
+            self.config.update(config)
+
+        with open(geometryFile) as f:
+            self.geometry = json.load(f)
+
+        self.rng = random.Random(seed)
+
+        self.cameras = self.config["cameras"]
+        self.nextTick = [cam["phase"] for cam in self.cameras]
+
+        # Frames as (capture time, camera for player 1, camera for player 2, frame ID, available time)
+        self.frames = []
+        self.maxMemory = 0.5
+
+        self.frameId = 0
+        self.lastAvailable = 0
+        self.stats = { "captured": 0, "dropped": 0, "occluded": 0, "skipped": 0 }
+
+    def reset(self, t=0):
+        self.nextTick = [t + cam["phase"] for cam in self.cameras]
+        self.frames = []
+        self.lastAvailable = t
+
+    def nextCaptureTime(self):
+        return min(self.nextTick)
+
+    def sample(self, t):
+        # Capture a frame for every camera whose tick has come
+        for ci, cam in enumerate(self.cameras):
+            if t < self.nextTick[ci]:
+                continue
+
+            period = 1 / cam["fps"]
+            ticks = math.floor((t - self.nextTick[ci]) / period)
+            self.stats["skipped"] += ticks
+            self.nextTick[ci] += (ticks + 1) * period
+
+            self.capture(ci, t)
+
+        while len(self.frames) > 0 and t - self.frames[0][0] > self.maxMemory:
+            self.frames.pop(0)
+
+    def capture(self, ci, t):
+        cam = self.cameras[ci]
+
+        # Frame IDs are consumed by lost frames too, so consumers can detect the gaps
+        self.frameId += 1
+        self.stats["captured"] += 1
+
+        if self.rng.random() < cam["dropout"]:
+            self.stats["dropped"] += 1
+            return
+
+        latency = max(self.rng.gauss(cam["latencyMean"], cam["latencyStd"]), cam["latencyMin"])
+
+        # Frames are delivered in order
+        available = max(t + latency, self.lastAvailable)
+        self.lastAvailable = available
+
+        fresh = [self.sim.getCameraDict(1), self.sim.getCameraDict(2)]
+
+        # The figures hide the same part of the ball from both perspectives
+        cd = fresh[0]["camData"][ci]
+        visibility = self.ballVisibility(cd["ball_x"], cd["ball_y"], cd["rod_position_calib"])
+        detected = cd["ball_size"] * visibility >= self.config["minBallSize"]
+        if not detected:
+            self.stats["occluded"] += 1
+
+        previous = self.frames[-1] if len(self.frames) > 0 else None
+
+        views = []
+        for player in range(2):
+            view = fresh[player]
+            camData = list(view["camData"])
+            camDataOK = list(view["camDataOK"])
+
+            if previous is not None:
+                # The other camera keeps its latest data
+                oi = 1 - ci
+                camData[oi] = previous[player + 1]["camData"][oi]
+                camDataOK[oi] = previous[player + 1]["camDataOK"][oi]
+
+            cd = dict(camData[ci])
+            cd["ball_size"] = cd["ball_size"] * visibility
+            if not detected and previous is not None:
+                # The ball was not found, report its last known position
+                old = previous[player + 1]["camData"][ci]
+                cd.update({ k: old[k] for k in ("ball_x", "ball_y", "ball_vx", "ball_vy") })
+            camData[ci] = cd
+            camDataOK[ci] = detected
+
+            views.append({ "camData": camData, "camDataOK": camDataOK, "score": view["score"], "frameID": self.frameId })
+
+        self.frames.append((t, views[0], views[1], self.frameId, available))
+
+    def ballVisibility(self, bx, by, rodPositions):
+        # Fraction of the ball not hidden under a player figure (seen from above, red perspective)
+        ballSize = self.geometry["ball_size"]
+        fw, fd = self.config["figureWidth"], self.config["figureDepth"]
+
+        hidden = 0
+        for i, rg in enumerate(self.geometry["rods"]):
+            ox = min(bx + ballSize/2, rg["position"] + fw/2) - max(bx - ballSize/2, rg["position"] - fw/2)
+            if ox <= 0:
+                continue
+
+            pos = rg["travel"] * rodPositions[i]
+            for ip in range(rg["players"]):
+                py = rg["first_offset"] + pos + ip * rg["spacing"]
+                oy = min(by + ballSize/2, py + fd/2) - max(by - ballSize/2, py - fd/2)
+                if oy > 0:
+                    hidden = max(hidden, ox * oy / ballSize**2)
+
+        return 1 - hidden
+
+    def latestFrame(self, t):
+        # Newest frame that is available at time t
+        frames = self.frames
+        for i in range(len(frames) - 1, -1, -1):
+            if frames[i][4] <= t:
+                return frames[i]
+
+        return None
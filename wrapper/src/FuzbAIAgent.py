@@ -1,3 +1,4 @@
+import os
 import json
 import time
 import math
@@ -6,8 +7,8 @@ import random
 class PlayerAgent():
     def __init__(self):
 
-        # Load geometry json
-        f = open('../www/geometry.json')
+        # Load geometry json (relative to this file, the agent is also created from the server's directory)
+        f = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'www', 'geometry.json'))
         self.geometry = json.load(f)
         f.close()
 
@@ -4,10 +4,13 @@ import time, datetime
 import threading
 import math
 from FuzbAIAgent import *
+from PolicyAgent import PolicyAgent
+from CameraPipeline import CameraPipeline
+from ActuatorModel import ActuatorModel
 import random
 
 class FuzbAISim:
-    def __init__(self):
+    def __init__(self, redPolicy=None, bluePolicy=None):
         print(" ______         _             _____ ")
         print("|  ____|       | |      /\   |_   _|")
         print("| |__ _   _ ___| |__   /  \    | |  ")
@@ -47,18 +50,20 @@ class FuzbAISim:
         self.travels = [190, 356, 180, 116, 116, 180, 356, 190]
         self.redIndices = [0, 1, 3, 5]
 
-        self.p1 = PlayerAgent()
-        self.p2 = PlayerAgent()
+        self.p1 = None
+        self.p2 = None
+        self.setAgent(1, redPolicy)
+        self.setAgent(2, bluePolicy)
 
-        # Camera delay settings
+        # Camera delay settings (callers ask for t - simulatedDelay, the actual latency comes from the camera pipeline)
         self.simulatedDelay = 0.040
-        self.delayedMemory = []
-        self.maxMemory = 0.5 # Maximum delay time
 
-        # Deadband settings
-        self.prevRefPositions = [0]*8
-        self.motionDirection = [1]*8
-        self.motorDeadband = 0.005
+        # Camera frame rate, latency, dropouts and occlusion (camera.json), frames are numbered
+        self.camera = CameraPipeline(self, 'camera.json', '../www/geometry.json')
+        self.cameraPeriod = 1 / max(cam["fps"] for cam in self.camera.cameras)
+
+        # Rod motors (actuator.json, shared with the simulator in sim/), created with the table model
+        self.actuators = None
 
         self.loadSimulator(False)
 
@@ -72,6 +77,24 @@ class FuzbAISim:
         self.motorCommandsExternal1 = []
         self.motorCommandsExternal2 = []
 
+        # External command filtering and expiry (index 0 = player 1, index 1 = player 2)
+        self.commandTimeout = 0.5       # Commands older than this (in s) expire to the neutral pose
+        self.commandLateThreshold = 0.1 # Commands delivered later than this (in s) are counted as late
+        self.commandSeq = [0, 0]
+        self.commandSendTime = [0, 0]
+        self.commandTime = [None, None] # Arrival time of the latest commands, None once expired
+        self.commandStats = [{ "dropped": 0, "late": 0, "expired": 0 }, { "dropped": 0, "late": 0, "expired": 0 }]
+
+    def setAgent(self, player, policy=None):
+        # Built-in (demo) agent of a player: PlayerAgent, or an exported policy (.npz, see PolicyAgent.py)
+        # playing from its own side of the field
+        agent = PlayerAgent() if policy is None else PolicyAgent(policy, "red" if player == 1 else "blue", "own")
+
+        if player == 1:
+            self.p1 = agent
+        else:
+            self.p2 = agent
+
     def getCameraDict(self, player = 1):
         ball_x, ball_y = 1000*self.ballPos[0] - 115, 730 - 1000*self.ballPos[1]
         ball_vx, ball_vy = self.ballVel[0][0] + (random.random() - 0.5) * self.ballVelNoise, -self.ballVel[0][1] + (random.random() - 0.5) * self.ballVelNoise
@@ -150,44 +173,71 @@ class FuzbAISim:
 
 
     def sampleCameras(self, t):
-        self.delayedMemory.append((t, self.getCameraDict(1), self.getCameraDict(2)))
+        self.camera.sample(t)
 
-        while len(self.delayedMemory) > 0 and t - self.delayedMemory[0][0] > self.maxMemory:
-            self.delayedMemory.pop(0)
+    def getDelayedFrame(self, t):
+        # Returns (capture time, camera for player 1, camera for player 2, frame ID, available time)
+        return self.camera.latestFrame(t + self.simulatedDelay)
 
     def getDelayedCamera(self, player, t):
-        if len(self.delayedMemory) == 0:
+        frame = self.getDelayedFrame(t)
+        if frame is None:
             return None
 
-        for i in range(len(self.delayedMemory)):
-            if self.delayedMemory[i][0] >= t:
-                return self.delayedMemory[i][player]
-    
-        # Return first (the oldest) by default
-        return self.delayedMemory[0][player]
+        return frame[player]
 
-    def nudgeBall(self):
-        velocityNoise = 0.1
-        p.resetBaseVelocity(self.ball, linearVelocity=[random.random()*velocityNoise,random.random()*velocityNoise,0])
+    def nextFrameTime(self, frameId):
+        # Simulation time at which the delayed camera moves on from frameId to the next frame
+        for frame in self.camera.frames:
+            if frame[3] > frameId:
+                return frame[4]
+
+        # Not captured yet
+        return self.camera.nextCaptureTime() + min(cam["latencyMin"] for cam in self.camera.cameras)
+
+    def setExternalCommands(self, player, commands, seq = None, sendTime = None):
+        i = player - 1
+        t = time.time()
+
+        if seq is not None:
+            if sendTime is None:
+                sendTime = t
+
+            # Drop commands that arrive out of order, unless the sender was restarted in the meantime
+            if seq <= self.commandSeq[i] and sendTime <= self.commandSendTime[i] + self.commandTimeout:
+                self.commandStats[i]["dropped"] += 1
+                return False
+
+            self.commandSeq[i] = seq
+            self.commandSendTime[i] = sendTime
+
+            if t - sendTime > self.commandLateThreshold:
+                self.commandStats[i]["late"] += 1
 
-    def applyMotorDeadband(self, i, newPos):    
-        motionDiff = newPos - self.prevRefPositions[i]
-
-        if motionDiff > self.motorDeadband and self.motionDirection[i] <= 0:
-            # Changed direction - forward
-            self.motionDirection[i] = 1
-        elif motionDiff < -self.motorDeadband and self.motionDirection[i] >= 0:
-            # Changed direction - backward
-            self.motionDirection[i] = -1
-        elif (self.motionDirection[i] >= 0 and motionDiff > 0) or (self.motionDirection[i] <= 0 and motionDiff < 0):
-            # Change nothing - motion in the same direction
-            pass    
+        self.commandTime[i] = t
+
+        if player == 1:
+            self.motorCommandsExternal1 = commands
         else:
-            # Inside the deadband - ignore motion
-            return self.prevRefPositions[i]
+            self.motorCommandsExternal2 = commands
+
+        return True
+
+    def expireExternalCommands(self, player):
+        # Returns the neutral pose once the latest external commands are older than commandTimeout
+        i = player - 1
 
-        self.prevRefPositions[i] = newPos
-        return newPos
+        if self.commandTime[i] is None or time.time() - self.commandTime[i] < self.commandTimeout:
+            return []
+
+        self.commandTime[i] = None
+        self.commandStats[i]["expired"] += 1
+
+        return [{ "driveID": d, "rotationTargetPosition": 0, "rotationVelocity": 0.5, "translationTargetPosition": 0.5, "translationVelocity": 0.5 } for d in range(1, 5)]
+
+    def nudgeBall(self):
+        velocityNoise = 0.1
+        p.resetBaseVelocity(self.ball, linearVelocity=[random.random()*velocityNoise,random.random()*velocityNoise,0])
 
     def loadSimulator(self, printJointInfo = False):
         print("Loading simulator...")
@@ -265,6 +315,8 @@ class FuzbAISim:
 
         p.resetDebugVisualizerCamera(cameraDistance=1, cameraYaw=0,cameraPitch=-80, cameraTargetPosition=[0.72,0.375,0])
 
+        self.actuators = ActuatorModel(self.mizaId, self.revJoints, self.slideJoints, self.travels, 'actuator.json', tableConventions=True)
+
         # Enable realtime simulation
         p.setRealTimeSimulation(1)
         #p.setTimeStep(1/200) # Not working with realtime simulation
@@ -351,9 +403,6 @@ class FuzbAISim:
                 self.rodPositions = rodPoses
                 self.rodAngles = angles
 
-                linVel = 1.5910861528058136
-                rotVel = 174.74649915501303
-
                 # Process the agents...
                 if self.t - prev_t > 0.02:  
                     try:     
@@ -364,17 +413,10 @@ class FuzbAISim:
                             motors1 = self.motorCommandsExternal1
                             self.motorCommandsExternal1 = []        
 
-                        driveMap = [0, 1, 3, 5]
-                        for m in motors1:
-                            axisID = driveMap[m["driveID"]-1]
-                            jId_rot = self.revJoints[axisID]
-                            jId_lin = self.slideJoints[axisID]
+                            if len(motors1) == 0:
+                                motors1 = self.expireExternalCommands(1)
 
-                            refAngle = m["rotationTargetPosition"]*2*math.pi                
-                            p.setJointMotorControl2(self.mizaId, jId_rot, controlMode=p.POSITION_CONTROL, targetPosition=refAngle, force=2.0943448919793832, maxVelocity=rotVel*m["rotationVelocity"], positionGain=2.817867199313025, velocityGain=7.574019729635704)
-
-                            refPos = self.applyMotorDeadband(axisID, self.travels[axisID]*(1-m["translationTargetPosition"])/1000)
-                            p.setJointMotorControl2(self.mizaId, jId_lin, controlMode=p.POSITION_CONTROL, targetPosition=refPos, force=13.303989530423438, maxVelocity=linVel*m["translationVelocity"], positionGain=0.19343157707177333, velocityGain=3.9227062400839023)
+                        self.actuators.command("red", motors1, self.t)
                     except:
                         print("Exception in agent 1")
 
@@ -386,22 +428,17 @@ class FuzbAISim:
                             motors2 = self.motorCommandsExternal2
                             self.motorCommandsExternal2 = []        
 
-                        driveMap = [7, 6, 4, 2]                        
-                        for m in motors2:
-                            axisID = driveMap[m["driveID"]-1]
-                            jId_rot = self.revJoints[axisID]
-                            jId_lin = self.slideJoints[axisID]
-
-                            refAngle = -m["rotationTargetPosition"]*2*math.pi                
-                            p.setJointMotorControl2(self.mizaId, jId_rot, controlMode=p.POSITION_CONTROL, targetPosition=refAngle, force=2.0943448919793832, maxVelocity=rotVel*m["rotationVelocity"], positionGain=2.817867199313025, velocityGain=7.574019729635704)
+                            if len(motors2) == 0:
+                                motors2 = self.expireExternalCommands(2)
 
-                            refPos = self.applyMotorDeadband(axisID, self.travels[axisID]*(m["translationTargetPosition"])/1000)
-                            p.setJointMotorControl2(self.mizaId, jId_lin, controlMode=p.POSITION_CONTROL, targetPosition=refPos, force=13.303989530423438, maxVelocity=linVel*m["translationVelocity"], positionGain=0.19343157707177333, velocityGain=3.9227062400839023)
+                        self.actuators.command("blue", motors2, self.t)
                     except:
                         print("Exception in agent 2")
 
                     prev_t = self.t        
 
+                self.actuators.update(self.t)
+
                 self.sampleCameras(self.t)
                 #print("States: ", rodPositions, rodAngles)
                 #print(p.getLinkState(mizaId, 3))
@@ -1,7 +1,11 @@
 import socket
+import selectors
 import FuzbAISim
+import FuzbAIWire
+import FuzbAIShm
 import time
 import json
+import argparse
 
 # installer: pyinstaller --hidden-import numpy  FuzbAISimWrapper.py
 
@@ -9,52 +13,145 @@ UDP_IP = "127.0.0.1"
 UDP_PORT_TX = 15006
 UDP_PORT_RX1 = 15005
 UDP_PORT_RX2 = 15004
+UDP_PORT_STRIDE = 10
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+parser = argparse.ArgumentParser(prog='FuzbAI simulator')
+parser.add_argument('--wire', choices=['json', 'binary'], default='json', help='Format of the camera datagrams sent to the server')
+parser.add_argument('--command-timeout', type=float, default=0.5, help='Time (in s) after which external commands expire to the neutral pose')
+parser.add_argument('--transport', choices=['udp', 'shm'], default='udp', help='Transport to the server (shm: shared memory, server on the same host)')
+parser.add_argument('--table', type=int, default=0, help=f'Table index on the server (UDP ports are offset by {UDP_PORT_STRIDE} per table)')
+parser.add_argument('--red-policy', help='Exported policy (.npz) used by the built-in red player instead of the demo agent')
+parser.add_argument('--blue-policy', help='Exported policy (.npz) used by the built-in blue player instead of the demo agent')
+args = parser.parse_args()
 
-sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock1.setblocking(0)
-sock1.bind((UDP_IP, UDP_PORT_RX1))
+# Each table on the server uses its own set of UDP ports
+UDP_PORT_TX += UDP_PORT_STRIDE * args.table
+UDP_PORT_RX1 += UDP_PORT_STRIDE * args.table
+UDP_PORT_RX2 += UDP_PORT_STRIDE * args.table
 
-sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock2.setblocking(0)
-sock2.bind((UDP_IP, UDP_PORT_RX2))
+def receiveMotorData(player, data):
+    # The server replies in the same format as the camera datagrams, but accept both
+    if FuzbAIWire.isBinary(data):
+        seq, _, sendTime, commands = FuzbAIWire.decodeCommands(data)
+    else:
+        motorData = json.loads(data.decode('utf-8'))
+        seq, sendTime, commands = motorData.get("seq"), motorData.get("timestamp"), motorData["commands"]
+
+    # Out of order commands are dropped, stale ones expire in the simulator
+    sim.setExternalCommands(player, commands, seq, sendTime)
+
+def attachShm():
+    global shm, commandSeq, shmCheckTime
+
+    t = time.time()
+    if shm is not None:
+        if t - shmCheckTime < shmCheckInterval:
+            return
+        shmCheckTime = t
+
+        if not shm.replaced():
+            return
+        shm.close()
+        shm = None
+        print("Shared memory block closed by the server")
+
+    try:
+        shm = FuzbAIShm.SharedTransport(FuzbAIShm.blockName(args.table))
+    except (FileNotFoundError, ValueError):
+        return
+
+    # Commands written before attaching are not replayed
+    commandSeq = [shm.commandSeq(team) for team in range(2)]
+    shmCheckTime = t
+    print("Attached to the shared memory block of the server")
+
+if args.transport == 'shm':
+    # Binary frames and commands are exchanged through the server's shared memory block,
+    # attached when the server is running and again whenever the server is restarted
+    shm = None
+    commandSeq = [0, 0]
+    shmPollInterval = 0.001
+    shmCheckInterval = 1.0
+    shmCheckTime = 0
+else:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock1.setblocking(0)
+    sock1.bind((UDP_IP, UDP_PORT_RX1))
+
+    sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock2.setblocking(0)
+    sock2.bind((UDP_IP, UDP_PORT_RX2))
+
+    # Wait for motor commands of either player until the next camera frame is due
+    selector = selectors.DefaultSelector()
+    selector.register(sock1, selectors.EVENT_READ, 1)
+    selector.register(sock2, selectors.EVENT_READ, 2)
 
 # Start simulator
-sim = FuzbAISim.FuzbAISim()
+sim = FuzbAISim.FuzbAISim(args.red_policy, args.blue_policy)
+sim.commandTimeout = args.command_timeout
 sim.run()
 
 time.sleep(0.1)
 
+frameId = 0
+# The next frame can be due before the simulation thread has produced it (or the simulation is paused),
+# wait at least this long (in s) instead of spinning
+minWaitTime = 0.001
+
 # Star the update thread
 while sim.isRunning:    
-    #time.sleep(0.02)
-
-    # Send camera status
+    # Send camera status once per new frame
     try:
-        camStat = sim.getDelayedCamera(1, sim.t - sim.simulatedDelay)
-        sock.sendto(bytes(json.dumps(camStat), 'utf-8'), (UDP_IP, UDP_PORT_TX))        
+        frame = sim.getDelayedFrame(sim.t - sim.simulatedDelay)
+
+        if frame is not None and frame[3] != frameId:
+            simTime, camStat, _, frameId = frame
+
+            if args.transport == 'shm':
+                attachShm()
+                if shm is not None:
+                    shm.writeCamera(FuzbAIWire.encodeCamera(camStat, frameId, simTime, time.time()))
+            elif args.wire == 'binary':
+                sock.sendto(FuzbAIWire.encodeCamera(camStat, frameId, simTime, time.time()), (UDP_IP, UDP_PORT_TX))
+            else:
+                sock.sendto(bytes(json.dumps(dict(camStat, frameID=frameId)), 'utf-8'), (UDP_IP, UDP_PORT_TX))        
     except:
         pass
 
-    try:
-        while True:
-            data, addr = sock1.recvfrom(5000)
-            motorData = json.loads(data.decode('utf-8'))
-            
-            # Parse motor data
-            sim.motorCommandsExternal1 = motorData["commands"]
-    except socket.error:
-        pass    
+    timeout = min(max(sim.nextFrameTime(frameId) - sim.t, minWaitTime), sim.cameraPeriod)
 
-    try:
-        while True:
-            data, addr = sock2.recvfrom(5000)
-            motorData = json.loads(data.decode('utf-8'))
-            
-            # Parse motor data
-            sim.motorCommandsExternal2 = motorData["commands"]
-    except socket.error:
-        pass    
-
-print("###########################################\nSim stopped")
\ No newline at end of file
+    if args.transport == 'shm':
+        # Shared memory has no notification, poll it until the next frame
+        time.sleep(min(timeout, shmPollInterval))
+
+        attachShm()
+        if shm is None:
+            continue
+
+        for team in range(2):
+            commands = shm.readCommands(team, commandSeq[team])
+            if commands is not None:
+                commandSeq[team], data = commands
+                receiveMotorData(team + 1, data)
+        continue
+
+    for key, _ in selector.select(timeout):
+        try:
+            while True:
+                data, addr = key.fileobj.recvfrom(5000)
+                
+                # Parse motor data
+                receiveMotorData(key.data, data)
+        except socket.error:
+            pass    
+        except:
+            print(f"Invalid motor data from player {key.data}")
+
+if args.transport == 'shm' and shm is not None:
+    shm.close()
+
+print("###########################################\nSim stopped")
+print(f"External commands (dropped/late/expired): red {sim.commandStats[0]}, blue {sim.commandStats[1]}")
@@ -0,0 +1,90 @@
+import struct
+
+# Compact binary encoding of the camera frames and motor commands exchanged between
+# FuzbAISimWrapper and FuzbAISimServer. Keep this file identical in server/ and wrapper/src/.
+#
+# Every datagram starts with a fixed header:
+#   magic "FZ", version, message type, sequence number (camera frame ID or command sequence),
+#   simulation time (s) and send time (s, time.time() of the sender)
+#
+# Camera frame:   score (2x int32), camDataOK (2x bool) and 21 floats per camera
+#                 (ball_x, ball_y, ball_vx, ball_vy, ball_size, 8x rod_position_calib, 8x rod_angle)
+# Motor commands: number of commands (uint8), then driveID (uint8) and 4 floats per command
+#                 (rotationTargetPosition, rotationVelocity, translationTargetPosition, translationVelocity)
+#
+# JSON datagrams always start with '{', so both formats can be received on the same socket.
+
+MAGIC = b'FZ'
+VERSION = 1
+
+MSG_CAMERA = 1
+MSG_COMMANDS = 2
+
+HEADER = struct.Struct('<2sBBIdd')
+CAMERA = struct.Struct('<2i2?42f')
+COUNT = struct.Struct('<B')
+COMMAND = struct.Struct('<B4f')
+
+CAMERA_FIELDS = ["ball_x", "ball_y", "ball_vx", "ball_vy", "ball_size"]
+COMMAND_FIELDS = ["rotationTargetPosition", "rotationVelocity", "translationTargetPosition", "translationVelocity"]
+
+def isBinary(data):
+    return data[:2] == MAGIC
+
+def decodeHeader(data, msgType):
+    magic, version, dataType, seq, simTime, sendTime = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("Not a FuzbAI binary datagram")
+    if version != VERSION:
+        raise ValueError(f"Unsupported FuzbAI wire format version {version}")
+    if dataType != msgType:
+        raise ValueError(f"Unexpected message type {dataType}")
+
+    return seq, simTime, sendTime
+
+def encodeCamera(camStat, frameId, simTime, sendTime):
+    values = []
+    for cd in camStat["camData"]:
+        values += [cd[f] for f in CAMERA_FIELDS]
+        values += cd["rod_position_calib"]
+        values += cd["rod_angle"]
+
+    return HEADER.pack(MAGIC, VERSION, MSG_CAMERA, frameId, simTime, sendTime) + \
+        CAMERA.pack(*camStat["score"], *camStat["camDataOK"], *values)
+
+def decodeCamera(data):
+    # Returns (frame ID, simulation time, send time, camera dictionary)
+    frameId, simTime, sendTime = decodeHeader(data, MSG_CAMERA)
+    values = CAMERA.unpack_from(data, HEADER.size)
+
+    camData = []
+    for ci in range(2):
+        v = values[4 + 21*ci : 4 + 21*(ci+1)]
+        cd = { "cameraID": ci }
+        cd.update(zip(CAMERA_FIELDS, v[:5]))
+        cd["rod_position_calib"] = list(v[5:13])
+        cd["rod_angle"] = list(v[13:21])
+        camData.append(cd)
+
+    return frameId, simTime, sendTime, { "camData": camData, "camDataOK": list(values[2:4]), "score": list(values[0:2]) }
+
+def encodeCommands(commands, seq, simTime, sendTime):
+    data = [HEADER.pack(MAGIC, VERSION, MSG_COMMANDS, seq, simTime, sendTime), COUNT.pack(len(commands))]
+    for m in commands:
+        data.append(COMMAND.pack(m["driveID"], *[m[f] for f in COMMAND_FIELDS]))
+
+    return b''.join(data)
+
+def decodeCommands(data):
+    # Returns (sequence number, simulation time, send time, list of command dictionaries)
+    seq, simTime, sendTime = decodeHeader(data, MSG_COMMANDS)
+    count, = COUNT.unpack_from(data, HEADER.size)
+
+    commands = []
+    for values in COMMAND.iter_unpack(data[HEADER.size + COUNT.size : HEADER.size + COUNT.size + count*COMMAND.size]):
+        m = { "driveID": values[0] }
+        m.update(zip(COMMAND_FIELDS, values[1:]))
+        commands.append(m)
+
+    return seq, simTime, sendTime, commands